@@ -0,0 +1,296 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+from xml.sax.saxutils import escape
+
+INTERPRET = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'interpret.py')
+
+
+# Benchmark programs are generated, so huge ones do not have to be kept in the repository.
+# Every generator returns a list of instructions as (opcode, (type, value), ...).
+
+def var(name):
+    return 'var', name
+
+
+def integer(value):
+    return 'int', str(value)
+
+
+def string(value):
+    return 'string', value
+
+
+def label(name):
+    return 'label', name
+
+
+def int_loop(iterations=200000):
+    return [
+        ('DEFVAR', var('GF@i')), ('DEFVAR', var('GF@sum')), ('DEFVAR', var('GF@cond')),
+        ('MOVE', var('GF@i'), integer(0)), ('MOVE', var('GF@sum'), integer(0)),
+        ('LABEL', label('loop')),
+        ('ADD', var('GF@sum'), var('GF@sum'), var('GF@i')),
+        ('ADD', var('GF@i'), var('GF@i'), integer(1)),
+        ('LT', var('GF@cond'), var('GF@i'), integer(iterations)),
+        ('JUMPIFEQ', label('loop'), var('GF@cond'), ('bool', 'true')),
+        ('WRITE', var('GF@sum')),
+    ]
+
+
+def recursion(n=21):
+    # naive fibonacci, every call has its own frame
+    return [
+        ('DEFVAR', var('GF@result')),
+        ('CREATEFRAME',), ('PUSHFRAME',), ('DEFVAR', var('LF@n')), ('MOVE', var('LF@n'), integer(n)),
+        ('PUSHS', var('LF@n')), ('CALL', label('fib')), ('POPS', var('GF@result')), ('POPFRAME',),
+        ('WRITE', var('GF@result')),
+        ('JUMP', label('end')),
+        ('LABEL', label('fib')),
+        ('CREATEFRAME',), ('PUSHFRAME',),
+        ('DEFVAR', var('LF@n')), ('DEFVAR', var('LF@small')), ('DEFVAR', var('LF@a')), ('DEFVAR', var('LF@b')),
+        ('POPS', var('LF@n')),
+        ('LT', var('LF@small'), var('LF@n'), integer(2)),
+        ('JUMPIFEQ', label('fib_small'), var('LF@small'), ('bool', 'true')),
+        ('SUB', var('LF@a'), var('LF@n'), integer(1)),
+        ('PUSHS', var('LF@a')), ('CALL', label('fib')), ('POPS', var('LF@a')),
+        ('SUB', var('LF@b'), var('LF@n'), integer(2)),
+        ('PUSHS', var('LF@b')), ('CALL', label('fib')), ('POPS', var('LF@b')),
+        ('ADD', var('LF@n'), var('LF@a'), var('LF@b')),
+        ('LABEL', label('fib_small')),
+        ('PUSHS', var('LF@n')),
+        ('POPFRAME',),
+        ('RETURN',),
+        ('LABEL', label('end')),
+    ]
+
+
+def string_building(iterations=50000):
+    return [
+        ('DEFVAR', var('GF@i')), ('DEFVAR', var('GF@text')), ('DEFVAR', var('GF@cond')),
+        ('MOVE', var('GF@i'), integer(0)), ('MOVE', var('GF@text'), string('')),
+        ('LABEL', label('loop')),
+        ('CONCAT', var('GF@text'), var('GF@text'), string('ab')),
+        ('ADD', var('GF@i'), var('GF@i'), integer(1)),
+        ('LT', var('GF@cond'), var('GF@i'), integer(iterations)),
+        ('JUMPIFEQ', label('loop'), var('GF@cond'), ('bool', 'true')),
+        ('TYPE', var('GF@cond'), var('GF@text')),
+        ('WRITE', var('GF@cond')),
+    ]
+
+
+def stack_code(iterations=100000):
+    return [
+        ('DEFVAR', var('GF@i')),
+        ('MOVE', var('GF@i'), integer(0)),
+        ('LABEL', label('loop')),
+        ('PUSHS', var('GF@i')), ('PUSHS', integer(1)), ('ADDS',), ('POPS', var('GF@i')),
+        ('PUSHS', var('GF@i')), ('PUSHS', integer(iterations)),
+        ('JUMPIFNEQS', label('loop')),
+        ('WRITE', var('GF@i')),
+    ]
+
+
+def heavy_output(iterations=100000):
+    return [
+        ('DEFVAR', var('GF@i')), ('DEFVAR', var('GF@cond')),
+        ('MOVE', var('GF@i'), integer(0)),
+        ('LABEL', label('loop')),
+        ('WRITE', var('GF@i')), ('WRITE', string('\\010')),
+        ('ADD', var('GF@i'), var('GF@i'), integer(1)),
+        ('LT', var('GF@cond'), var('GF@i'), integer(iterations)),
+        ('JUMPIFEQ', label('loop'), var('GF@cond'), ('bool', 'true')),
+    ]
+
+
+def huge_program(size=200000):
+    # mostly loading, every instruction runs once
+    instructions = [('DEFVAR', var('GF@x')), ('MOVE', var('GF@x'), integer(0))]
+    for number in range(size):
+        instructions.append(('ADD', var('GF@x'), var('GF@x'), integer(number % 7)))
+    instructions.append(('WRITE', var('GF@x')))
+    return instructions
+
+
+PROGRAMS = {
+    'int_loop': int_loop,
+    'recursion': recursion,
+    'string_building': string_building,
+    'stack_code': stack_code,
+    'heavy_output': heavy_output,
+    'huge_program': huge_program,
+}
+
+
+def write_program(path, instructions):
+    with open(path, 'w') as file:
+        file.write('<?xml version="1.0" encoding="UTF-8"?>\n<program language="IPPcode23">\n')
+        for order, (opcode, *args) in enumerate(instructions, 1):
+            file.write(f'  <instruction order="{order}" opcode="{opcode}">')
+            for number, (arg_type, value) in enumerate(args, 1):
+                file.write(f'<arg{number} type="{arg_type}">{escape(value)}</arg{number}>')
+            file.write('</instruction>\n')
+        file.write('</program>\n')
+
+
+class Benchmark:
+    def __init__(self, args, directory):
+        self.args = args
+        self.directory = directory
+
+    def run_once(self, source, *extra):
+        # one run of the interpreter, returns its stats and peak RSS in kB
+        stats_path = os.path.join(self.directory, 'stats.json')
+        command = [sys.executable, self.args.interpreter, f'--source={source}', f'--stats={stats_path}']
+        if self.args.optimize:
+            command.append(f'--optimize={self.args.optimize}')
+        if self.args.engine:
+            command.append(f'--engine={self.args.engine}')
+        # extra options go last, so they override the ones above
+        command += extra
+        with open(os.devnull, 'w') as output, open(os.devnull) as stdin:
+            process = subprocess.Popen(command, stdin=stdin, stdout=output, stderr=output)
+            _, status, usage = os.wait4(process.pid, 0)
+        returncode = os.waitstatus_to_exitcode(status)
+        if returncode != 0:
+            raise RuntimeError(f"{source}: interpreter ended with {returncode}")
+        with open(stats_path) as file:
+            stats = json.load(file)
+        # ru_maxrss is in kB on Linux, in bytes on macOS
+        stats['rss'] = usage.ru_maxrss // 1024 if sys.platform == 'darwin' else usage.ru_maxrss
+        return stats
+
+    def count_instructions(self, source):
+        # the compiled engine can not be profiled, the count is the same with the interpreter
+        profile = os.path.join(self.directory, 'profile.json')
+        self.run_once(source, f'--profile={profile}', '--engine=interpreted')
+        with open(profile) as file:
+            return json.load(file)['count']
+
+    def measure(self, name):
+        source = os.path.join(self.directory, f'{name}.xml')
+        write_program(source, PROGRAMS[name]())
+        instructions = self.count_instructions(source)
+        for _ in range(self.args.warmup):
+            self.run_once(source)
+        runs = [self.run_once(source) for _ in range(self.args.repeat)]
+        load = [run['load'] for run in runs]
+        execute = [run['execute'] for run in runs]
+        return {
+            'instructions': instructions,
+            'load': summarize(load),
+            'execute': summarize(execute),
+            'instructions_per_second': instructions / statistics.median(execute),
+            'rss_kb': max(run['rss'] for run in runs),
+        }
+
+
+def summarize(values):
+    return {
+        'min': min(values),
+        'median': statistics.median(values),
+        'mean': statistics.mean(values),
+        'stdev': statistics.stdev(values) if len(values) > 1 else 0.0,
+    }
+
+
+def print_results(results):
+    print(f"{'program':<16} {'instructions':>12} {'load [s]':>10} {'execute [s]':>12} {'stdev':>8} "
+          f"{'instr/s':>12} {'peak RSS':>10}")
+    for name, result in results.items():
+        print(f"{name:<16} {result['instructions']:>12} {result['load']['median']:>10.4f} "
+              f"{result['execute']['median']:>12.4f} {result['execute']['stdev']:>8.4f} "
+              f"{result['instructions_per_second']:>12.0f} {result['rss_kb'] // 1024:>7} MB")
+
+
+def find_regressions(results, baseline, threshold, min_difference):
+    # times of a few milliseconds are mostly noise, so they have to grow also by min_difference seconds
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for phase in ('load', 'execute'):
+            before = baseline[name][phase]['median']
+            after = result[phase]['median']
+            if before > 0 and (after - before) / before > threshold and after - before > min_difference:
+                regressions.append(f"{name} {phase}: {before:.4f} s -> {after:.4f} s "
+                                   f"(+{100 * (after - before) / before:.1f} %)")
+        before = baseline[name]['rss_kb']
+        after = result['rss_kb']
+        if (after - before) / before > threshold:
+            regressions.append(f"{name} peak RSS: {before} kB -> {after} kB (+{100 * (after - before) / before:.1f} %)")
+    return regressions
+
+
+def append_history(path, record):
+    history = []
+    if os.path.exists(path):
+        with open(path) as file:
+            history = json.load(file)
+    history.append(record)
+    with open(path, 'w') as file:
+        json.dump(history, file, indent=1)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Benchmark interpret.py on generated IPPcode23 programs.')
+    parser.add_argument('programs', nargs='*', metavar='program',
+                        help=f"Programs to run, all by default: {', '.join(PROGRAMS)}.")
+    parser.add_argument('--interpreter', default=INTERPRET, help='Interpreter to benchmark.')
+    parser.add_argument('--optimize', default='', help='Optimization passes passed to the interpreter.')
+    parser.add_argument('--engine', default='', help='Execution engine passed to the interpreter.')
+    parser.add_argument('--warmup', type=int, default=1, help='Runs before the measured ones.')
+    parser.add_argument('--repeat', type=int, default=5, help='Measured runs of every program.')
+    parser.add_argument('--history', default='benchmark_history.json', help='JSON file the results are added to.')
+    parser.add_argument('--baseline', default='benchmark_baseline.json', help='JSON file with the baseline results.')
+    parser.add_argument('--save-baseline', action='store_true', help='Store the results as the new baseline.')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='Allowed slowdown against the baseline, 0.1 is 10 %%.')
+    parser.add_argument('--min-difference', type=float, default=0.005,
+                        help='Smallest slowdown in seconds that counts as a regression.')
+    args = parser.parse_args()
+    for name in args.programs:
+        if name not in PROGRAMS:
+            parser.error(f"unknown program {name}")
+    return args
+
+
+def main():
+    args = parse_arguments()
+    names = args.programs or list(PROGRAMS)
+    with tempfile.TemporaryDirectory() as directory:
+        benchmark = Benchmark(args, directory)
+        results = {name: benchmark.measure(name) for name in names}
+    print_results(results)
+
+    append_history(args.history, {
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'optimize': args.optimize,
+        'engine': args.engine,
+        'results': results,
+    })
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump(results, file, indent=1)
+        return
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            regressions = find_regressions(results, json.load(file), args.threshold, args.min_difference)
+        if regressions:
+            print("Regressions against the baseline:")
+            for regression in regressions:
+                print("  " + regression)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -72,4 +72,7 @@ instructions_map = {
     "INT2FLOAT": [ArgTypeEnum.VARIABLE, ArgTypeEnum.SYMBOL],
     "FLOAT2INT": [ArgTypeEnum.VARIABLE, ArgTypeEnum.SYMBOL],
     "DIV": [ArgTypeEnum.VARIABLE, ArgTypeEnum.SYMBOL, ArgTypeEnum.SYMBOL],
-}
\ No newline at end of file
+}
+# opcodes are stored as small numbers in the compact program representation
+opcodes = list(instructions_map)
+opcode_ids = {opcode: number for number, opcode in enumerate(opcodes)}
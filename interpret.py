@@ -1,9 +1,23 @@
-import copy
+import gc
+import hashlib
+import io
+import json
+import marshal
+import mmap
+import operator
+import os
 import re
+import signal
+import socket
+import struct
 import sys
+import time
+import traceback
 import argparse
+from array import array
 from curses.ascii import isdigit
 from enum import Enum
+from types import CodeType
 from xml.etree import ElementTree as ET
 import abc
 import instructions_map
@@ -11,12 +25,16 @@ import instructions_map
 DEBUG = False
 
 
+class StructureError(Exception):
+    pass
+
+
 class Instruction:
     args = []
 
     def __init__(self, opcode, order):
         self.args = []
-        self.opcode = opcode.upper()
+        self.opcode = sys.intern(opcode.upper())
         self.order = order
 
     def execute(self):
@@ -42,7 +60,7 @@ class Instruction:
         if len(self.args) != len(instructions_map.instructions_map[self.opcode]):
             if DEBUG:
                 print("Wrong number of arguments for instruction", self.opcode)
-            exit(32)
+            raise StructureError
         # check whether arguments are numbered correctly
 
         order = 1
@@ -51,16 +69,16 @@ class Instruction:
             if int(arg.order) != order:
                 if DEBUG:
                     print("Wrong order of arguments for instruction", self.opcode)
-                exit(32)
+                raise StructureError
             order += 1
 
-        # TODO this is maybe redundant
+        # literals are shared by the whole program, so a variable slot must never hold one
         for i in range(len(self.args)):
             if not (instructions_map.ArgTypeEnum.compare_types(self.args[i], self.args[i],
                                                                instructions_map.instructions_map[self.opcode][i])):
                 if DEBUG:
                     print("Wrong type of arguments for instruction", self.opcode)
-                    exit(53)
+                raise StructureError
 
 
 class Argument:
@@ -87,41 +105,245 @@ class Argument:
         self.frame = arg_frame
 
 
+class Operand:
+    # validated argument of an instruction, shared by all instructions using the same one
+    __slots__ = ('is_var', 'arg_type', 'value', 'frame', 'name', 'resolve')
+
+    def __init__(self, is_var, arg_type, value, frame=None, name=None):
+        self.is_var = is_var
+        self.arg_type = arg_type
+        self.value = value
+        self.frame = frame
+        self.name = name
+        self.resolve = None
+
+    def constant_resolver(self):
+        # literals resolve to themselves, one function is shared by all instructions using the literal
+        if self.resolve is None:
+            operand = self
+
+            def resolve_constant(state):
+                return operand
+            self.resolve = resolve_constant
+        return self.resolve
+
+    def key(self):
+        if self.is_var:
+            return 'var', self.frame, self.name
+        if self.arg_type == 'float':
+            # 0.0 and -0.0 are equal, but they are different literals
+            return self.arg_type, self.value.hex()
+        return self.arg_type, self.value
+
+
+class Program:
+    # Instructions are kept in parallel arrays: the opcode number, the source order and the start
+    # of the instruction operands. Operands are numbers of deduplicated Operands in the constant pool.
+    def __init__(self):
+        self.opcodes = array('B')
+        self.orders = array('q')
+        self.arg_starts = array('I')
+        self.operands = array('I')
+        self.constants = []
+        self.constant_ids = {}
+        self.labels = {}
+
+    def __len__(self):
+        return len(self.opcodes)
+
+    def intern_operand(self, argument):
+        value = sys.intern(argument.value) if isinstance(argument.value, str) else argument.value
+        name = sys.intern(argument.name) if argument.is_var else None
+        operand = Operand(argument.is_var, argument.arg_type, value, argument.frame, name)
+        key = operand.key()
+        if self.constant_ids is None:
+            self.constant_ids = {constant.key(): number for number, constant in enumerate(self.constants)}
+        number = self.constant_ids.get(key)
+        if number is None:
+            number = len(self.constants)
+            self.constants.append(operand)
+            self.constant_ids[key] = number
+        return number
+
+    def append(self, opcode, order, args):
+        self.opcodes.append(instructions_map.opcode_ids[opcode])
+        self.orders.append(order)
+        self.arg_starts.append(len(self.operands))
+        for argument in args:
+            self.operands.append(self.intern_operand(argument))
+
+    def finish(self):
+        # the lookup table for deduplication is only needed while the program is being built
+        self.constant_ids = None
+
+    def opcode(self, index):
+        return instructions_map.opcodes[self.opcodes[index]]
+
+    def args(self, index):
+        start = self.arg_starts[index]
+        end = start + len(instructions_map.instructions_map[self.opcode(index)])
+        return [self.constants[number] for number in self.operands[start:end]]
+
+    def instruction(self, index):
+        instruction = Instruction(self.opcode(index), self.orders[index])
+        instruction.args = self.args(index)
+        return instruction
+
+    def sort(self):
+        orders = self.orders
+        if all(orders[i] < orders[i + 1] for i in range(len(orders) - 1)):
+            return
+        permutation = sorted(range(len(self)), key=orders.__getitem__)
+        self.opcodes = array('B', [self.opcodes[i] for i in permutation])
+        self.orders = array('q', [orders[i] for i in permutation])
+        self.arg_starts = array('I', [self.arg_starts[i] for i in permutation])
+
+    def pack(self):
+        constants = tuple((operand.is_var, operand.arg_type, operand.value, operand.frame, operand.name)
+                          for operand in self.constants)
+        return (self.opcodes.tobytes(), self.orders.tobytes(), self.arg_starts.tobytes(), self.operands.tobytes(),
+                constants, self.labels)
+
+    @classmethod
+    def unpack(cls, data):
+        program = cls()
+        opcodes, orders, arg_starts, operands, constants, program.labels = data
+        program.opcodes.frombytes(opcodes)
+        program.orders.frombytes(orders)
+        program.arg_starts.frombytes(arg_starts)
+        program.operands.frombytes(operands)
+        program.constants = [Operand(*constant) for constant in constants]
+        program.finish()
+        return program
+
+
+class Variable:
+    # variables do not know their frame, so frames can be moved between TF and LF as they are
+    __slots__ = ('name', 'value', 'arg_type')
+
+    def __init__(self, name):
+        self.name = name
+        self.value = None
+        self.arg_type = None
+
+    def append(self, text):
+        # CONCAT of the variable with itself, longer strings are built in place instead of copied
+        value = self.value
+        if len(value) < StringBuilder.min_length:
+            self.value = value + text
+            return
+        builder = io.StringIO(newline='')
+        builder.write(value)
+        builder.write(text)
+        self.value = builder
+        self.__class__ = StringBuilder
+
+    def prefix(self, length):
+        return self.value[:length]
+
+
+class StringBuilder(Variable):
+    # String variable CONCAT keeps appending to. Its value slot holds a StringIO, the string is made
+    # only when the value is read and the variable is a plain Variable again.
+    __slots__ = ()
+    min_length = 256
+    builder = Variable.value
+
+    @property
+    def value(self):
+        text = self.builder.getvalue()
+        self.__class__ = Variable
+        self.value = text
+        return text
+
+    @value.setter
+    def value(self, value):
+        self.__class__ = Variable
+        self.value = value
+
+    def append(self, text):
+        self.builder.write(text)
+
+    def prefix(self, length):
+        # the start of the string without making it
+        builder = self.builder
+        builder.seek(0)
+        text = builder.read(length)
+        builder.seek(0, 2)
+        return text
+
+
 class Frame:
     def __init__(self, parent=None):
         self.parent = parent
         self.variables = {}
 
-    def change_tf_to_lf(self):
+    def print_all_vars(self):
         for key, variable in self.variables.items():
-            variable.frame = "LF"
+            print("name:", variable.name, ",value:", variable.value, ",type:", variable.arg_type)
 
-    def change_lf_to_tf(self):
-        for key, variable in self.variables.items():
-            variable.frame = "TF"
 
-    def print_all_vars(self):
-        for key, variable in self.variables.items():
-            print("name:", variable.name, ",value:", variable.value, ",frame:", variable.frame)
+class Output:
+    def __init__(self, stream, buffer_size):
+        self.stream = stream
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.size = 0
+
+    def write(self, text):
+        self.buffer.append(text)
+        self.size += len(text)
+        if self.size >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.stream.write(''.join(self.buffer))
+            self.buffer = []
+            self.size = 0
+        self.stream.flush()
 
 
 class Interpreter:
     def __init__(self, parser, args):
-        self.defined_vars = []
-        self.defined_labels = []
-        self.defined_vars_names = []
         self.labels = []
         self.data_stack = []
         self.parser = parser
-        self.arithmetic = ['ADD', 'SUB', 'MUL', 'IDIV', 'DIV']
-        self.relational = ['LT', 'GT', 'EQ']
-        self.logical = ['AND', 'OR', 'NOT']
-        self.input = args.input.split('\n')
-        self.read_index = 0
+        self.program = parser.program
+        self.int_operations = {'ADD': operator.add, 'SUB': operator.sub, 'MUL': operator.mul,
+                               'IDIV': operator.floordiv}
+        self.float_operations = {'ADD': operator.add, 'SUB': operator.sub, 'MUL': operator.mul,
+                                 'DIV': operator.truediv}
+        self.relational_operations = {'LT': operator.lt, 'GT': operator.gt, 'EQ': operator.eq}
+        self.code = []
+        self.resolvers = {}
+        # names of the optional optimization passes to run while decoding
+        self.optimizations = args.optimize
+        # file for the JSON execution profile, the profiled engine is used only when it is set
+        self.profile = args.profile
+        # file for the folded call stacks, CALL and RETURN are timed only when it is set
+        self.call_profile = args.profile_calls
+        self.call_profiler = None
+        # number of last executed instructions kept for the trace dumped on abnormal exit
+        self.trace_size = args.trace_last
+        self.trace_file = args.trace_file
+        # the compiled engine translates the program to Python, see Compiler
+        self.engine = args.engine
+        self.cache_dir = args.cache_dir
+        # input is consumed line by line, only when READ asks for it
+        self.input = args.input
+        # WRITE goes to the output channel, DPRINT and BREAK to the debug channel
+        self.output = Output(args.output, args.output_buffer)
+        self.debug_output = Output(sys.stderr, args.output_buffer)
         self.frames = []
         self.labels = []
+        self.global_frame = Frame()
         self.frames_stack = []
         self.temporary_frame = None
+        # changed whenever TF or LF is replaced, invalidates the cached variables of those frames
+        self.frame_generation = 0
+        self.frame_pool = []
+        self.frame_pool_size = 16
         self.stack = []
 
     def is_hex_string(self, s):
@@ -131,75 +353,102 @@ class Interpreter:
         except ValueError:
             return False
 
-    def is_number_with_optional_minus(self, value):
-        value_str = str(value)
-        pattern = r'^-?\d+$'
-        return bool(re.match(pattern, value_str))
-
-    def find_arg(self, argument):
-        # if not var is given, original argument is returned
-        if argument.big_type != instructions_map.ArgTypeEnum.VARIABLE:
-            return argument
-        # if var is given, it is searched in defined variables
-        for arg in self.defined_vars:
-            if argument.frame == 'TF':
-                #   TODO
-
-                if self.temporary_frame is None:
-                    if DEBUG:
-                        print("Wrong frame")
-                    exit(55)
-                for variable in self.temporary_frame.variables.values():
-                    if variable.name == argument.name:
-                        return variable
-
+    def flush_output(self):
+        self.output.flush()
+        self.debug_output.flush()
+
+    def format_value(self, value, arg_type):
+        # values are kept as python objects and turned into text only on output
+        if arg_type == 'bool':
+            return 'true' if value else 'false'
+        if arg_type == 'float':
+            return float.hex(value)
+        if value is None:
+            return ''
+        return str(value)
+
+    def convert_input(self, line, value_type):
+        # invalid input is read as nil
+        try:
+            if value_type == 'int':
+                return int(line), 'int'
+            if value_type == 'float':
+                return Parser.convert_float(line), 'float'
+        except ValueError:
+            return None, 'nil'
+        if value_type == 'bool':
+            return line.lower() == 'true', 'bool'
+        return line, 'string'
+
+    def get_frame(self, frame_name):
+        if frame_name == 'GF':
+            return self.global_frame
+        if frame_name == 'TF':
+            if self.temporary_frame is None:
                 if DEBUG:
-                    print("Variable not defined")
-                    print('here this happens')
-                    print(argument.name, self.temporary_frame.variables)
+                    print("Temporary frame not defined")
                 exit(55)
+            return self.temporary_frame
+        if len(self.frames_stack) == 0:
+            if DEBUG:
+                print("Local frame not defined")
+            exit(55)
+        return self.frames_stack[-1]
 
+    def new_frame(self):
+        if self.frame_pool:
+            return self.frame_pool.pop()
+        return Frame()
 
-            if argument.frame == 'LF':
-                if len(self.frames_stack) == 0:
-                    if DEBUG:
-                        print("Wrong frame")
-                    exit(55)
-                for variable in self.frames_stack[-1].variables.values():
-                    if variable.name == argument.name:
-                        return variable
-
-                if DEBUG:
-                    print("Variable not defined")
-                    print(argument.name, self.defined_vars)
-                exit(55)
-            if argument.name == arg.name and argument.frame == arg.frame:
-                return arg
-        if DEBUG:
-            print("Variable not defined")
-            print(argument.name, self.defined_vars)
-        exit(54)
-
-        # def find_arg(self, argument):
-        #     # if not var is given, original argument is returned
-        #     if argument.big_type != instructions_map.ArgTypeEnum.VARIABLE:
-        #         return argument
-        #
-        #     # if var is given, it is searched in defined variables
-        #     for arg in self.defined_vars:
-        #         if argument.name == arg.name and argument.frame != arg.frame:
-        #             exit(55)
-        #         if argument.name == arg.name and argument.frame == arg.frame:
-        #             # check if the frame exists
-        #             if arg.frame == "GF" or (arg.frame == "LF" and len(self.frames_stack) > 0):
-        #                 return arg
-        #             else:
-        #                 exit(54)
+    def release_frame(self, frame):
+        # dropped frames are kept for reuse by CREATEFRAME
+        if frame is not None and len(self.frame_pool) < self.frame_pool_size:
+            frame.variables.clear()
+            self.frame_pool.append(frame)
 
-        if DEBUG:
-            print("Variable not defined")
-            print(argument.name, self.defined_vars)
-        exit(54)
+    def find_arg(self, argument):
+        # if not var is given, original argument is returned
+        if not argument.is_var:
+            return argument
+        # if var is given, it is searched in its frame
+        variable = self.get_frame(argument.frame).variables.get(argument.name)
+        if variable is None:
+            if DEBUG:
+                print("Variable not defined")
+                print(argument.frame, argument.name)
+            exit(54)
+        return variable
+
+    def resolver(self, argument):
+        # Returns a function resolving the argument. Variables are looked up once and cached. Global
+        # variables never go away, local and temporary ones are valid only until the frames change,
+        # which is tracked by frame_generation. Operands are shared, so are their resolvers.
+        if not argument.is_var:
+            return argument.constant_resolver()
+        resolve = self.resolvers.get(argument)
+        if resolve is None:
+            resolve = self.resolvers[argument] = self.variable_resolver(argument)
+        return resolve
+
+    def variable_resolver(self, argument):
+        variable = None
+        if argument.frame == 'GF':
+            def resolve_global(state):
+                nonlocal variable
+                if variable is None:
+                    variable = state.find_arg(argument)
+                return variable
+            return resolve_global
+
+        generation = -1
+
+        def resolve_frame_variable(state):
+            nonlocal variable, generation
+            if generation != state.frame_generation:
+                variable = state.find_arg(argument)
+                generation = state.frame_generation
+            return variable
+        return resolve_frame_variable
 
     def format_hex_float(self, hex_float_str):
         hex_float = float.fromhex(hex_float_str)
@@ -207,529 +456,2282 @@ class Interpreter:
             return f"{hex_float.hex()}"
         return f"{hex_float.hex()}0"
 
-    def check_var(self, arg):
-        if arg.arg_type == 'var':
-            if arg.name not in self.defined_vars:
-                if DEBUG:
-                    print("Variable not defined")
-                    print(arg.name, self.defined_vars)
-                exit(54)
-
     def set_var(self, var, value, value_type):
-        self.check_var(var)
-        for arg in self.defined_vars:
-            if arg.name == var.name:
-                arg.value = value
-                arg.arg_type = value_type
+        var.value = value
+        var.arg_type = value_type
 
-    def check_logical(self, instruction):
-        if instruction.opcode == 'NOT':
-            if not self.find_arg(instruction.args[1]).arg_type == 'bool':
+    def check_logical(self, *symbols):
+        for symb in symbols:
+            if symb.arg_type != 'bool':
                 if DEBUG:
                     print("Invalid types for logical operation")
-                    # print names of variables
                 exit(53)
-        elif not (self.find_arg(instruction.args[1]).arg_type == 'bool' and
-                  self.find_arg(instruction.args[2]).arg_type == 'bool'):
-            if DEBUG:
-                print("Invalid types for logical operation")
-                # print names of variables
-            exit(53)
 
-    def check_relational(self, instruction):
-        if not (self.find_arg(instruction.args[1]).arg_type == 'int' and
-                self.find_arg(instruction.args[2]).arg_type == 'int') and not (
-                self.find_arg(instruction.args[1]).arg_type == 'bool' and
-                self.find_arg(instruction.args[2]).arg_type == 'bool') and not (
-                self.find_arg(instruction.args[1]).arg_type == 'string' and
-                self.find_arg(instruction.args[2]).arg_type == 'string') and not (
-                self.find_arg(instruction.args[1]).arg_type == 'nil' or
-                self.find_arg(instruction.args[2]).arg_type == 'nil'):
+    def check_relational(self, symb1, symb2):
+        if not (symb1.arg_type == symb2.arg_type and symb1.arg_type in ('int', 'bool', 'string')) and not (
+                symb1.arg_type == 'nil' or symb2.arg_type == 'nil'):
             if DEBUG:
                 print("Invalid types for relational operation")
-                # print names of variables
             exit(53)
 
-    def check_arithmetic(self, instruction):
-        if not (self.find_arg(instruction.args[1]).arg_type == 'int' and self.find_arg(
-                instruction.args[2]).arg_type == 'int') and not (
-                self.find_arg(instruction.args[1]).arg_type == 'float' and self.find_arg(
-            instruction.args[2]).arg_type == 'float'):
+    def check_arithmetic(self, symb1, symb2):
+        if not (symb1.arg_type == 'int' and symb2.arg_type == 'int') and not (
+                symb1.arg_type == 'float' and symb2.arg_type == 'float'):
             if DEBUG:
                 print("Invalid types for arithmetic operation")
-                # print names of variables
-                print()
-                print(self.find_arg(instruction.args[1]).name, self.find_arg(instruction.args[2]).name)
-                print(self.find_arg(instruction.args[1]).arg_type, self.find_arg(instruction.args[2]).arg_type)
-                for arg in self.defined_vars:
-                    print(arg.name, arg.value, arg.arg_type, arg.frame)
+                print(symb1.name, symb2.name)
+                print(symb1.arg_type, symb2.arg_type)
+                self.global_frame.print_all_vars()
             exit(53)
 
-    def execute(self):
-        if DEBUG:
-            print("Executing instructions")
-
-        instruction_pointer = 0
-        while instruction_pointer < len(self.parser.instructions):
-            instruction = self.parser.instructions[instruction_pointer]
-
-            if instruction.opcode == 'DEFVAR':
-                if instruction.args[0].frame == 'TF':
-                    if self.temporary_frame is None:
-                        if DEBUG:
-                            print("Temporary frame not defined")
-                        exit(55)
-                    self.temporary_frame.variables[instruction.args[0].name] = instruction.args[0]
-                if instruction.args[0].frame == 'LF':
-                    if len(self.frames_stack) == 0:
-                        if DEBUG:
-                            print("Local frame not defined")
-                        exit(55)
-                self.defined_vars_names.append(instruction.args[0].name)
-                self.defined_vars.append(instruction.args[0])
-
-            elif instruction.opcode == 'READ':
-                var = self.find_arg(instruction.args[0])
-                typ = self.find_arg(instruction.args[1])
-                input = self.input[self.read_index]
-
-                self.set_var(var, input, typ.value)
-                self.read_index += 1
-
-            elif instruction.opcode == 'MOVE':
-                var = self.find_arg(instruction.args[0])
-                symb = self.find_arg(instruction.args[1])
-                self.set_var(var, symb.value, symb.arg_type)
-
-            elif instruction.opcode == 'EXIT':
-                symb = self.find_arg(instruction.args[0])
-                if symb.arg_type != 'int':
-                    if DEBUG:
-                        print("Invalid types for exit")
+    def decode(self):
+        # bind every instruction to its handler, so that execute does not have to look at opcodes
+        decoders = {
+            'DEFVAR': self.decode_defvar,
+            'READ': self.decode_read,
+            'MOVE': self.decode_move,
+            'EXIT': self.decode_exit,
+            'CREATEFRAME': self.decode_createframe,
+            'PUSHFRAME': self.decode_pushframe,
+            'POPFRAME': self.decode_popframe,
+            'CALL': self.decode_call,
+            'RETURN': self.decode_return,
+            'TYPE': self.decode_type,
+            'ADD': self.decode_arithmetic,
+            'SUB': self.decode_arithmetic,
+            'MUL': self.decode_arithmetic,
+            'IDIV': self.decode_arithmetic,
+            'DIV': self.decode_arithmetic,
+            'LT': self.decode_relational,
+            'GT': self.decode_relational,
+            'EQ': self.decode_relational,
+            'AND': self.decode_logical,
+            'OR': self.decode_logical,
+            'NOT': self.decode_logical,
+            'PUSHS': self.decode_pushs,
+            'POPS': self.decode_pops,
+            'INT2CHAR': self.decode_int2char,
+            'STRI2INT': self.decode_stri2int,
+            'BREAK': self.decode_break,
+            'DPRINT': self.decode_dprint,
+            'LABEL': self.decode_label,
+            'JUMP': self.decode_jump,
+            'JUMPIFEQ': self.decode_conditional_jump,
+            'JUMPIFNEQ': self.decode_conditional_jump,
+            'INT2FLOAT': self.decode_int2float,
+            'FLOAT2INT': self.decode_float2int,
+            'CONCAT': self.decode_concat,
+            'WRITE': self.decode_write,
+            'CLEARS': self.decode_clears,
+            'ADDS': self.decode_stack_arithmetic,
+            'SUBS': self.decode_stack_arithmetic,
+            'MULS': self.decode_stack_arithmetic,
+            'IDIVS': self.decode_stack_arithmetic,
+            'LTS': self.decode_stack_relational,
+            'GTS': self.decode_stack_relational,
+            'EQS': self.decode_stack_relational,
+            'ANDS': self.decode_stack_logical,
+            'ORS': self.decode_stack_logical,
+            'NOTS': self.decode_stack_logical,
+            'INT2CHARS': self.decode_int2chars,
+            'STRI2INTS': self.decode_stri2ints,
+            'JUMPIFEQS': self.decode_stack_conditional_jump,
+            'JUMPIFNEQS': self.decode_stack_conditional_jump,
+        }
+        self.code = []
+        gc.disable()
+        try:
+            if 'fold' in self.optimizations:
+                self.optimize_program()
+            specializers = {}
+            if 'types' in self.optimizations:
+                specializers = self.infer_types()
+            for index in range(len(self.program)):
+                instruction = self.program.instruction(index)
+                decoder = specializers.get(index) or decoders.get(instruction.opcode, self.decode_nop)
+                self.code.append(decoder(index, instruction))
+            # the compiled code calls the handlers of single instructions
+            if 'peephole' in self.optimizations and self.engine != 'compiled':
+                self.fuse_instructions()
+            if self.call_profile:
+                self.profile_calls()
+        finally:
+            gc.enable()
+
+    # Every decode_* method returns a handler taking the interpreter state. A handler returns None
+    # to continue with the next instruction, or the index of the instruction to continue with.
+
+    def decode_nop(self, index, instruction):
+        def handler(state):
+            return None
+        return handler
+
+    def decode_defvar(self, index, instruction):
+        arg = instruction.args[0]
+        frame_name = arg.frame
+        name = arg.name
+
+        def handler(state):
+            frame = state.get_frame(frame_name)
+            if name not in frame.variables:
+                frame.variables[name] = Variable(name)
+        return handler
+
+    def decode_read(self, index, instruction):
+        var_arg, type_arg = instruction.args
+        resolve_var = self.resolver(var_arg)
+
+        def handler(state):
+            var = resolve_var(state)
+            line = state.input.readline()
+            if line:
+                value, value_type = state.convert_input(line.rstrip('\n'), type_arg.value)
+            else:
+                # end of input
+                value, value_type = None, 'nil'
+            state.set_var(var, value, value_type)
+        return handler
+
+    def decode_move(self, index, instruction):
+        var_arg, symb_arg = instruction.args
+        resolve_var = self.resolver(var_arg)
+        resolve_symb = self.resolver(symb_arg)
+
+        def handler(state):
+            var = resolve_var(state)
+            symb = resolve_symb(state)
+            state.set_var(var, symb.value, symb.arg_type)
+        return handler
+
+    def decode_exit(self, index, instruction):
+        symb_arg = instruction.args[0]
+        resolve_symb = self.resolver(symb_arg)
+
+        def handler(state):
+            symb = resolve_symb(state)
+            if symb.arg_type != 'int':
+                if DEBUG:
+                    print("Invalid types for exit")
+                exit(53)
+            value = symb.value
+            if value < 0 or value > 49:
+                if DEBUG:
+                    print("Invalid value for exit")
+                exit(57)
+            exit(value)
+        return handler
+
+    def decode_createframe(self, index, instruction):
+        def handler(state):
+            state.release_frame(state.temporary_frame)
+            state.temporary_frame = state.new_frame()
+            state.frame_generation += 1
+        return handler
+
+    def decode_pushframe(self, index, instruction):
+        def handler(state):
+            if state.temporary_frame is None:
+                if DEBUG:
+                    print("Temporary frame not defined")
+                exit(55)
+            state.frames_stack.append(state.temporary_frame)
+            state.temporary_frame = None
+            state.frame_generation += 1
+        return handler
+
+    def decode_popframe(self, index, instruction):
+        def handler(state):
+            if len(state.frames_stack) == 0:
+                if DEBUG:
+                    print("Stack is empty")
+                exit(55)
+            state.release_frame(state.temporary_frame)
+            state.temporary_frame = state.frames_stack.pop()
+            state.frame_generation += 1
+        return handler
+
+    def decode_call(self, index, instruction):
+        target = self.program.labels[instruction.args[0].value] + 1
+
+        def handler(state):
+            state.labels.append(index + 1)
+            return target
+        return handler
+
+    def decode_return(self, index, instruction):
+        def handler(state):
+            if len(state.labels) == 0:
+                if DEBUG:
+                    print("No label to return to")
+                exit(56)
+            return state.labels.pop()
+        return handler
+
+    def decode_type(self, index, instruction):
+        var_arg, symb_arg = instruction.args
+        resolve_var = self.resolver(var_arg)
+        resolve_symb = self.resolver(symb_arg)
+
+        def handler(state):
+            var = resolve_var(state)
+            symb = resolve_symb(state)
+            # uninitialized variables have no type
+            state.set_var(var, symb.arg_type or '', 'string')
+        return handler
+
+    def decode_arithmetic(self, index, instruction):
+        var_arg, symb1_arg, symb2_arg = instruction.args
+        opcode = instruction.opcode
+        int_operation = self.int_operations.get(opcode)
+        float_operation = self.float_operations.get(opcode)
+        resolve_symb1 = self.resolver(symb1_arg)
+        resolve_symb2 = self.resolver(symb2_arg)
+        resolve_var = self.resolver(var_arg)
+
+        def handler(state):
+            symb1 = resolve_symb1(state)
+            symb2 = resolve_symb2(state)
+            state.check_arithmetic(symb1, symb2)
+            var = resolve_var(state)
+            operation = float_operation if symb1.arg_type == 'float' else int_operation
+            if operation is None:
+                return None
+            if opcode in ('IDIV', 'DIV') and symb2.value == 0:
+                if DEBUG:
+                    print("Division by zero")
+                exit(57)
+            state.set_var(var, operation(symb1.value, symb2.value), symb1.arg_type)
+        return handler
+
+    def decode_relational(self, index, instruction):
+        var_arg, symb1_arg, symb2_arg = instruction.args
+        opcode = instruction.opcode
+        relational_operation = self.relational_operations[opcode]
+        resolve_symb1 = self.resolver(symb1_arg)
+        resolve_symb2 = self.resolver(symb2_arg)
+        resolve_var = self.resolver(var_arg)
+
+        def handler(state):
+            symb1 = resolve_symb1(state)
+            symb2 = resolve_symb2(state)
+            state.check_relational(symb1, symb2)
+            var = resolve_var(state)
+            if symb1.arg_type == 'nil' or symb2.arg_type == 'nil':
+                if opcode != 'EQ':
                     exit(53)
-                value = int(symb.value)
-                if value < 0 or value > 49:
-                    if DEBUG:
-                        print("Invalid value for exit")
-                    exit(57)
-                exit(value)
-
-            elif instruction.opcode == 'CREATEFRAME':
-                self.temporary_frame = None
-                self.temporary_frame = Frame()
-
-            elif instruction.opcode == 'PUSHFRAME':
-
-                # TODO
-                if self.temporary_frame is None:
-                    if DEBUG:
-                        print("Temporary frame not defined")
-                    exit(55)
-                self.temporary_frame.change_tf_to_lf()
-                self.frames_stack.append(copy.deepcopy(self.temporary_frame))
-                self.temporary_frame = None
-            elif instruction.opcode == 'POPFRAME':
-                # TODO
-                if len(self.frames_stack) == 0:
-                    if DEBUG:
-                        print("Stack is empty")
-                    exit(55)
-                self.temporary_frame = self.frames_stack.pop()
-                self.temporary_frame.change_lf_to_tf()
-
-                    # self.frames_stack[-1].print_all_vars()
-
-
-
-
-            elif instruction.opcode == 'CALL':
-                # inplmented jump
-                found = False
-                label = self.find_arg(instruction.args[0])
-                self.labels.append(instruction_pointer)
-                label_string = label.value
-                # find the instruction with the matching label
-                for i in range(0, len(self.parser.instructions)):
-                    if self.parser.instructions[i].opcode == 'LABEL' and \
-                            self.parser.instructions[i].args[0].value == label_string:
-                        found = True
-                        instruction_pointer = i
-                        break
-                if not found:
-                    if DEBUG:
-                        print("Label not found")
-                    exit(52)
-
-            elif instruction.opcode == 'RETURN':
-                if len(self.labels) == 0:
-                    if DEBUG:
-                        print("No label to return to")
-                    exit(56)
-                instruction_pointer = self.labels.pop()
-
-            elif instruction.opcode == 'TYPE':
-                var = self.find_arg(instruction.args[0])
-                symb = self.find_arg(instruction.args[1])
-                if symb.arg_type == 'nil':
-                    self.set_var(var, '', 'string')
-                else:
-                    self.set_var(var, symb.arg_type, 'string')
-
-
-
-
-
-            elif instruction.opcode in self.arithmetic:
-                self.check_arithmetic(instruction)
-                float_flag = self.find_arg(instruction.args[1]).arg_type == 'float'
-                var = self.find_arg(instruction.args[0])
-                symb1 = self.find_arg(instruction.args[1])
-                symb2 = self.find_arg(instruction.args[2])
-                if not float_flag:
-                    if not (self.is_number_with_optional_minus(symb1.value) and self.is_number_with_optional_minus(
-                            symb2.value)):
-                        if DEBUG:
-                            print("Invalid types for arithmetic operation")
-                            print(symb1.value, symb2.value)
-                        exit(32)
-                    if instruction.opcode == 'ADD':
-                        self.set_var(var, int(symb1.value) + int(symb2.value), symb1.arg_type)
-                    elif instruction.opcode == 'SUB':
-                        self.set_var(var, int(symb1.value) - int(symb2.value), symb1.arg_type)
-                    elif instruction.opcode == 'MUL':
-                        self.set_var(var, int(symb1.value) * int(symb2.value), symb1.arg_type)
-                    elif instruction.opcode == 'IDIV':
-                        if symb2.value == '0':
-                            if DEBUG:
-                                print("Division by zero")
-                            exit(57)
-                        self.set_var(var, int(symb1.value) // int(symb2.value), symb1.arg_type)
-                else:
-                    number1 = float.fromhex(symb1.value)
-                    number2 = float.fromhex(symb2.value)
-                    if instruction.opcode == 'ADD':
-                        self.set_var(var, float.hex(number1 + number2), symb1.arg_type)
-                    elif instruction.opcode == 'SUB':
-                        self.set_var(var, float.hex(number1 - number2), symb1.arg_type)
-                    elif instruction.opcode == 'MUL':
-                        self.set_var(var, float.hex(number1 * number2), symb1.arg_type)
-                    elif instruction.opcode == 'DIV':
-                        if number2 == 0:
-                            if DEBUG:
-                                print("Division by zero")
-                            exit(57)
-                        self.set_var(var, float.hex(number1 // number2), symb1.arg_type)
-
-            elif instruction.opcode in self.relational:
-                self.check_relational(instruction)
-                var = self.find_arg(instruction.args[0])
-                symb1 = self.find_arg(instruction.args[1])
-                symb2 = self.find_arg(instruction.args[2])
-                if instruction.opcode == 'LT':
-                    if symb1.arg_type == 'int':
-                        bool_str = 'true' if int(symb1.value) < int(symb2.value) else 'false'
-                        self.set_var(var, bool_str, 'bool')
-                    elif symb1.arg_type == 'string':
-                        bool_str = 'true' if symb1.value < symb2.value else 'false'
-                        self.set_var(var, bool_str, 'bool')
-                    elif symb1.arg_type == 'bool':
-                        bool_str = 'true' if symb1.value == 'false' and symb2.value == 'true' else 'false'
-                        self.set_var(var, bool_str, 'bool')
-                    elif symb1.arg_type == 'nil':
-                        exit(53)
-                elif instruction.opcode == 'GT':
-                    if symb1.arg_type == 'int':
-                        bool_str = 'true' if int(symb1.value) > int(symb2.value) else 'false'
-                        self.set_var(var, bool_str, 'bool')
-                    elif symb1.arg_type == 'string':
-                        bool_str = 'true' if symb1.value > symb2.value else 'false'
-                        self.set_var(var, bool_str, 'bool')
-                    elif symb1.arg_type == 'bool':
-                        bool_str = 'true' if symb1.value == 'true' and symb2.value == 'false' else 'false'
-                        self.set_var(var, bool_str, 'bool')
-                    elif symb1.arg_type == 'nil':
-                        exit(53)
-                elif instruction.opcode == 'EQ':
-                    if symb1.arg_type == 'int':
-                        bool_str = 'true' if int(symb1.value) == int(symb2.value) else 'false'
-                        self.set_var(var, bool_str, 'bool')
-                    elif symb1.arg_type == 'string':
-                        bool_str = 'true' if symb1.value == symb2.value else 'false'
-                        self.set_var(var, bool_str, 'bool')
-                    elif symb1.arg_type == 'bool':
-                        bool_str = 'true' if symb1.value == symb2.value else 'false'
-                        self.set_var(var, bool_str, 'bool')
-                    elif symb1.arg_type == 'nil':
-                        bool_str = 'true' if symb1.value == symb2.value else 'false'
-                        self.set_var(var, bool_str, 'bool')
-                elif instruction.opcode == 'GT':
-                    bool_str = 'true' if int(symb1.value) > int(symb2.value) else 'false'
-                    self.set_var(var, bool_str, 'bool')
-                elif instruction.opcode == 'EQ':
-                    bool_str = 'true' if symb1.value == symb2.value else 'false'
-                    self.set_var(var, bool_str, 'bool')
-
-
-            elif instruction.opcode in self.logical:
-                self.check_logical(instruction)
-                if instruction.opcode == 'NOT':
-                    var = self.find_arg(instruction.args[0])
-                    symb = self.find_arg(instruction.args[1])
-                    # setting var to true if symb is false
-                    if symb.value == 'false':
-                        self.set_var(var, 'true', 'bool')
-                    # setting var to false if symb is true
-                    elif symb.value == 'true':
-                        self.set_var(var, 'false', 'bool')
+                result = symb1.arg_type == symb2.arg_type
+            else:
+                result = relational_operation(symb1.value, symb2.value)
+            state.set_var(var, result, 'bool')
+        return handler
+
+    def decode_logical(self, index, instruction):
+        var_arg = instruction.args[0]
+        symb_args = instruction.args[1:]
+        opcode = instruction.opcode
+        resolvers = [self.resolver(symb_arg) for symb_arg in symb_args]
+        resolve_var = self.resolver(var_arg)
+
+        def handler(state):
+            symbols = [resolve(state) for resolve in resolvers]
+            state.check_logical(*symbols)
+            var = resolve_var(state)
+            if opcode == 'NOT':
+                result = not symbols[0].value
+            elif opcode == 'AND':
+                result = symbols[0].value and symbols[1].value
+            else:
+                result = symbols[0].value or symbols[1].value
+            state.set_var(var, result, 'bool')
+        return handler
+
+    def decode_pushs(self, index, instruction):
+        symb_arg = instruction.args[0]
+        resolve_symb = self.resolver(symb_arg)
+
+        def handler(state):
+            symb = resolve_symb(state)
+            # the data stack holds plain (type, value) pairs
+            state.stack.append((symb.arg_type, symb.value))
+        return handler
+
+    def decode_pops(self, index, instruction):
+        var_arg = instruction.args[0]
+        resolve_var = self.resolver(var_arg)
+
+        def handler(state):
+            if len(state.stack) == 0:
+                if DEBUG:
+                    print("Stack is empty")
+                exit(56)
+            var = resolve_var(state)
+            arg_type, value = state.stack.pop()
+            state.set_var(var, value, arg_type)
+        return handler
+
+    def decode_int2char(self, index, instruction):
+        var_arg, symb_arg = instruction.args
+        resolve_var = self.resolver(var_arg)
+        resolve_symb = self.resolver(symb_arg)
+
+        def handler(state):
+            var = resolve_var(state)
+            symb = resolve_symb(state)
+            if symb.arg_type != 'int':
+                if DEBUG:
+                    print("INT2CHAR: symb is not int")
+                exit(53)
+            try:
+                char = chr(symb.value)
+            except ValueError:
+                if DEBUG:
+                    print("INT2CHAR: symb is not in range 0-1114111")
+                exit(58)
+            state.set_var(var, char, 'string')
+        return handler
+
+    def decode_stri2int(self, index, instruction):
+        var_arg, symb1_arg, symb2_arg = instruction.args
+        resolve_var = self.resolver(var_arg)
+        resolve_symb1 = self.resolver(symb1_arg)
+        resolve_symb2 = self.resolver(symb2_arg)
+
+        def handler(state):
+            var = resolve_var(state)
+            symb1 = resolve_symb1(state)
+            symb2 = resolve_symb2(state)
+            if symb1.arg_type != 'string' or symb2.arg_type != 'int':
+                if DEBUG:
+                    print("STRI2INT: symb1 or symb2 is not string or int")
+                exit(53)
+            position = symb2.value
+            if position < 0 or position >= len(symb1.value):
+                if DEBUG:
+                    print("STRI2INT: index is out of range")
+                exit(58)
+            state.set_var(var, ord(symb1.value[position]), 'int')
+        return handler
+
+    def decode_break(self, index, instruction):
+        def handler(state):
+            write = state.debug_output.write
+            write("instruction: %d\n" % (index + 1))
+            write("stack:\n")
+            for arg_type, value in state.stack:
+                write(state.format_value(value, arg_type) + '\n')
+            write("frame stack: %d\n" % len(state.frames_stack))
+        return handler
+
+    def decode_dprint(self, index, instruction):
+        symb_arg = instruction.args[0]
+        resolve_symb = self.resolver(symb_arg)
+
+        def handler(state):
+            symb = resolve_symb(state)
+            state.debug_output.write(state.format_value(symb.value, symb.arg_type) + '\n')
+        return handler
+
+    def decode_label(self, index, instruction):
+        # labels are resolved by Parser.index_labels
+        return self.decode_nop(index, instruction)
+
+    def decode_jump(self, index, instruction):
+        target = self.program.labels[instruction.args[0].value] + 1
+
+        def handler(state):
+            return target
+        return handler
+
+    def decode_conditional_jump(self, index, instruction):
+        label_arg, symb1_arg, symb2_arg = instruction.args
+        target = self.program.labels[label_arg.value] + 1
+        jump_if_equal = instruction.opcode == 'JUMPIFEQ'
+        resolve_symb1 = self.resolver(symb1_arg)
+        resolve_symb2 = self.resolver(symb2_arg)
+
+        def handler(state):
+            symb1 = resolve_symb1(state)
+            symb2 = resolve_symb2(state)
+            if symb1.arg_type != symb2.arg_type or symb1.arg_type == 'nil':
+                if DEBUG:
+                    print("Invalid type")
+                exit(53)
+            if (symb1.value == symb2.value) == jump_if_equal:
+                return target
+        return handler
+
+    def decode_int2float(self, index, instruction):
+        var_arg, symb_arg = instruction.args
+        resolve_var = self.resolver(var_arg)
+        resolve_symb = self.resolver(symb_arg)
+
+        def handler(state):
+            var = resolve_var(state)
+            symb = resolve_symb(state)
+            if symb.arg_type == 'int':
+                state.set_var(var, float(symb.value), 'float')
+            elif symb.arg_type is None:
+                if DEBUG:
+                    print("Invalid type2 for int2float")
+                exit(56)
+            else:
+                if DEBUG:
+                    print("Invalid type for int2float")
+                exit(53)
+        return handler
+
+    def decode_float2int(self, index, instruction):
+        var_arg, symb_arg = instruction.args
+        resolve_var = self.resolver(var_arg)
+        resolve_symb = self.resolver(symb_arg)
+
+        def handler(state):
+            var = resolve_var(state)
+            symb = resolve_symb(state)
+            if symb.arg_type == 'float':
+                state.set_var(var, int(symb.value), 'int')
+            elif symb.arg_type is None:
+                if DEBUG:
+                    print("Invalid type2 for float2int")
+                exit(56)
+            else:
+                if DEBUG:
+                    print("Invalid type for float2int")
+                    print(symb.arg_type)
+                exit(53)
+        return handler
+
+    def decode_concat(self, index, instruction):
+        var_arg, symb1_arg, symb2_arg = instruction.args
+        resolve_var = self.resolver(var_arg)
+        resolve_symb1 = self.resolver(symb1_arg)
+        resolve_symb2 = self.resolver(symb2_arg)
+
+        def handler(state):
+            var = resolve_var(state)
+            symb1 = resolve_symb1(state)
+            symb2 = resolve_symb2(state)
+            if symb1.arg_type == 'string' and symb2.arg_type == 'string':
+                if var is symb1:
+                    # the appended value is read first, it can be the variable itself
+                    text = symb2.value
+                    var.append(text)
                 else:
-                    var = self.find_arg(instruction.args[0])
-                    symb1 = self.find_arg(instruction.args[1])
-                    symb2 = self.find_arg(instruction.args[2])
-                    if instruction.opcode == 'AND':
-                        if symb1.value == 'true' and symb2.value == 'true':
-                            self.set_var(var, 'true', 'bool')
-                        else:
-                            self.set_var(var, 'false', 'bool')
-                    elif instruction.opcode == 'OR':
-                        if symb1.value == 'true' or symb2.value == 'true':
-                            self.set_var(var, 'true', 'bool')
-                        else:
-                            self.set_var(var, 'false', 'bool')
+                    state.set_var(var, symb1.value + symb2.value, 'string')
+            else:
+                if DEBUG:
+                    print("Invalid type for concat")
+                exit(53)
+        return handler
 
-            elif instruction.opcode == 'PUSHS':
-                symb = self.find_arg(instruction.args[0])
-                self.stack.append(symb)
+    def decode_write(self, index, instruction):
+        symb_arg = instruction.args[0]
+        resolve_symb = self.resolver(symb_arg)
 
-            elif instruction.opcode == 'POPS':
-                if len(self.stack) == 0:
-                    if DEBUG:
-                        print("Stack is empty")
-                    exit(56)
+        def handler(state):
+            symb = resolve_symb(state)
+            if symb.arg_type == 'string':
+                # escapes are decoded when the program is loaded
+                state.output.write(symb.value)
+            else:
+                state.output.write(state.format_value(symb.value, symb.arg_type))
+        return handler
 
-                var = self.find_arg(instruction.args[0])
-                symb = self.stack.pop()
-                self.set_var(var, symb.value, symb.arg_type)
+    # Stack instructions work on the (type, value) pairs of the data stack directly, without
+    # resolving any operands.
 
-            elif instruction.opcode == 'INT2CHAR':
-                var = self.find_arg(instruction.args[0])
-                symb = self.find_arg(instruction.args[1])
-                if symb.arg_type != 'int':
+    def stack_underflow(self):
+        if DEBUG:
+            print("Not enough values on the stack")
+        exit(56)
+
+    def decode_clears(self, index, instruction):
+        def handler(state):
+            state.stack.clear()
+        return handler
+
+    def decode_stack_arithmetic(self, index, instruction):
+        opcode = instruction.opcode[:-1]
+        int_operation = self.int_operations.get(opcode)
+        float_operation = self.float_operations.get(opcode)
+
+        def handler(state):
+            stack = state.stack
+            if len(stack) < 2:
+                state.stack_underflow()
+            type2, value2 = stack.pop()
+            type1, value1 = stack.pop()
+            if type1 != type2:
+                if DEBUG:
+                    print("Invalid types for arithmetic operation")
+                exit(53)
+            if type1 == 'int':
+                operation = int_operation
+            elif type1 == 'float':
+                operation = float_operation
+            else:
+                operation = None
+            if operation is None:
+                if DEBUG:
+                    print("Invalid types for arithmetic operation")
+                exit(53)
+            if opcode == 'IDIV' and value2 == 0:
+                if DEBUG:
+                    print("Division by zero")
+                exit(57)
+            stack.append((type1, operation(value1, value2)))
+        return handler
+
+    def decode_stack_relational(self, index, instruction):
+        opcode = instruction.opcode[:-1]
+        relational_operation = self.relational_operations[opcode]
+
+        def handler(state):
+            stack = state.stack
+            if len(stack) < 2:
+                state.stack_underflow()
+            type2, value2 = stack.pop()
+            type1, value1 = stack.pop()
+            if type1 == 'nil' or type2 == 'nil':
+                if opcode != 'EQ':
                     if DEBUG:
-                        print("INT2CHAR: symb is not int")
+                        print("Invalid types for relational operation")
                     exit(53)
-                try:
-                    char = chr(int(symb.value))
-                except ValueError:
-                    if DEBUG:
-                        print("INT2CHAR: symb is not in range 0-1114111")
-                    exit(58)
-                self.set_var(var, char, 'string')
-
-            elif instruction.opcode == 'STRI2INT':
-                var = self.find_arg(instruction.args[0])
-                symb1 = self.find_arg(instruction.args[1])
-                symb2 = self.find_arg(instruction.args[2])
-                if symb1.arg_type != 'string' or symb2.arg_type != 'int':
+                result = type1 == type2
+            elif type1 != type2 or type1 not in ('int', 'bool', 'string'):
+                if DEBUG:
+                    print("Invalid types for relational operation")
+                exit(53)
+            else:
+                result = relational_operation(value1, value2)
+            stack.append(('bool', result))
+        return handler
+
+    def decode_stack_logical(self, index, instruction):
+        opcode = instruction.opcode[:-1]
+
+        def handler(state):
+            stack = state.stack
+            if opcode == 'NOT':
+                if not stack:
+                    state.stack_underflow()
+                arg_type, value = stack.pop()
+                if arg_type != 'bool':
                     if DEBUG:
-                        print("STRI2INT: symb1 or symb2 is not string or int")
+                        print("Invalid types for logical operation")
                     exit(53)
-                try:
-                    int_value = ord(symb1.value[int(symb2.value)])
-                except IndexError:
-                    if DEBUG:
-                        print("STRI2INT: index is out of range")
-                    exit(58)
-                self.set_var(var, int_value, 'int')
-
-            elif instruction.opcode == 'BREAK':
-                print("stack:")
-                for i in range(0, len(self.stack)):
-                    print(self.stack[i].value)
-                print("frame stack:")
-                for i in range(0, len(self.frame_stack)):
-                    print(self.frame_stack[i].frame_name)
-
-            elif instruction.opcode == 'DPRINT':
-                symb = self.find_arg(instruction.args[0])
-                print(symb.value, file=sys.stderr)
-
-
-            # Instrukce pro řízení toku programu
-            elif instruction.opcode == 'LABEL':
-                label = self.find_arg(instruction.args[0])
-                if label.value in self.defined_labels:
-                    if DEBUG:
-                        print("Label already exists")
-                    exit(52)
+                stack.append(('bool', not value))
+                return None
+            if len(stack) < 2:
+                state.stack_underflow()
+            type2, value2 = stack.pop()
+            type1, value1 = stack.pop()
+            if type1 != 'bool' or type2 != 'bool':
+                if DEBUG:
+                    print("Invalid types for logical operation")
+                exit(53)
+            if opcode == 'AND':
+                stack.append(('bool', value1 and value2))
+            else:
+                stack.append(('bool', value1 or value2))
+        return handler
+
+    def decode_int2chars(self, index, instruction):
+        def handler(state):
+            stack = state.stack
+            if not stack:
+                state.stack_underflow()
+            arg_type, value = stack.pop()
+            if arg_type != 'int':
+                if DEBUG:
+                    print("INT2CHARS: symb is not int")
+                exit(53)
+            try:
+                char = chr(value)
+            except ValueError:
+                if DEBUG:
+                    print("INT2CHARS: symb is not in range 0-1114111")
+                exit(58)
+            stack.append(('string', char))
+        return handler
+
+    def decode_stri2ints(self, index, instruction):
+        def handler(state):
+            stack = state.stack
+            if len(stack) < 2:
+                state.stack_underflow()
+            type2, position = stack.pop()
+            type1, string = stack.pop()
+            if type1 != 'string' or type2 != 'int':
+                if DEBUG:
+                    print("STRI2INTS: symb1 or symb2 is not string or int")
+                exit(53)
+            if position < 0 or position >= len(string):
+                if DEBUG:
+                    print("STRI2INTS: index is out of range")
+                exit(58)
+            stack.append(('int', ord(string[position])))
+        return handler
+
+    def decode_stack_conditional_jump(self, index, instruction):
+        target = self.program.labels[instruction.args[0].value] + 1
+        jump_if_equal = instruction.opcode == 'JUMPIFEQS'
+
+        def handler(state):
+            stack = state.stack
+            if len(stack) < 2:
+                state.stack_underflow()
+            type2, value2 = stack.pop()
+            type1, value1 = stack.pop()
+            if type1 != type2 or type1 == 'nil':
+                if DEBUG:
+                    print("Invalid type")
+                exit(53)
+            if (value1 == value2) == jump_if_equal:
+                return target
+        return handler
+
+    # Load time optimization. Instructions whose operands are all literals are folded into MOVEs,
+    # unreachable instructions, unused labels and DEFVARs of unused global variables are removed.
+    # Instructions that would fail are kept as they are, so the error happens at the same point.
+
+    def optimize_program(self):
+        program = self.program
+        instructions = [(program.opcode(index), program.orders[index], program.args(index))
+                        for index in range(len(program))]
+        instructions = self.fold_constants(instructions)
+        instructions = self.remove_unreachable(instructions)
+        instructions = self.remove_unused_labels(instructions)
+        instructions = self.remove_unused_variables(instructions)
+
+        optimized = Program()
+        for opcode, order, args in instructions:
+            if opcode == 'LABEL':
+                optimized.labels[args[0].value] = len(optimized)
+            optimized.append(opcode, order, args)
+        optimized.finish()
+        self.program = optimized
+
+    def fold_constants(self, instructions):
+        folded = []
+        for opcode, order, args in instructions:
+            if opcode in ('JUMPIFEQ', 'JUMPIFNEQ') and not args[1].is_var and not args[2].is_var:
+                symb1, symb2 = args[1:]
+                if symb1.arg_type == symb2.arg_type and symb1.arg_type != 'nil':
+                    if (symb1.value == symb2.value) == (opcode == 'JUMPIFEQ'):
+                        folded.append(('JUMP', order, args[:1]))
+                    # a jump that is never taken is dropped
+                    continue
+            elif args and all(not arg.is_var for arg in args[1:]):
+                result = self.fold_instruction(opcode, args[1:])
+                if result is not None:
+                    arg_type, value = result
+                    folded.append(('MOVE', order, [args[0], Operand(False, arg_type, value)]))
+                    continue
+            folded.append((opcode, order, args))
+        return folded
+
+    def fold_instruction(self, opcode, symbols):
+        # returns the (type, value) the instruction would store, or None if it can not be folded
+        if not symbols:
+            return None
+        types = [symb.arg_type for symb in symbols]
+        values = [symb.value for symb in symbols]
+        if opcode in ('ADD', 'SUB', 'MUL', 'IDIV', 'DIV'):
+            if types[0] != types[1] or types[0] not in ('int', 'float'):
+                return None
+            operations = self.float_operations if types[0] == 'float' else self.int_operations
+            operation = operations.get(opcode)
+            if operation is None or (opcode in ('IDIV', 'DIV') and values[1] == 0):
+                return None
+            return types[0], operation(values[0], values[1])
+        if opcode in ('LT', 'GT', 'EQ'):
+            if 'nil' in types:
+                if opcode != 'EQ':
+                    return None
+                return 'bool', types[0] == types[1]
+            if types[0] != types[1] or types[0] not in ('int', 'bool', 'string'):
+                return None
+            return 'bool', self.relational_operations[opcode](values[0], values[1])
+        if opcode in ('AND', 'OR', 'NOT'):
+            if any(arg_type != 'bool' for arg_type in types):
+                return None
+            if opcode == 'NOT':
+                return 'bool', not values[0]
+            if opcode == 'AND':
+                return 'bool', values[0] and values[1]
+            return 'bool', values[0] or values[1]
+        if opcode == 'CONCAT':
+            if types != ['string', 'string']:
+                return None
+            return 'string', values[0] + values[1]
+        if opcode == 'INT2CHAR':
+            if types != ['int'] or not 0 <= values[0] <= 0x10FFFF:
+                return None
+            return 'string', chr(values[0])
+        if opcode == 'STRI2INT':
+            if types != ['string', 'int'] or not 0 <= values[1] < len(values[0]):
+                return None
+            return 'int', ord(values[0][values[1]])
+        if opcode == 'INT2FLOAT':
+            if types != ['int']:
+                return None
+            try:
+                return 'float', float(values[0])
+            except OverflowError:
+                return None
+        if opcode == 'FLOAT2INT':
+            if types != ['float']:
+                return None
+            try:
+                return 'int', int(values[0])
+            except (OverflowError, ValueError):
+                return None
+        if opcode == 'TYPE':
+            return 'string', types[0]
+        return None
+
+    def remove_unreachable(self, instructions):
+        labels = {args[0].value: index for index, (opcode, order, args) in enumerate(instructions)
+                  if opcode == 'LABEL'}
+        reachable = [False] * len(instructions)
+        pending = [0]
+        while pending:
+            index = pending.pop()
+            if index >= len(instructions) or reachable[index]:
+                continue
+            reachable[index] = True
+            opcode, order, args = instructions[index]
+            if opcode in self.parser.jump_opcodes:
+                pending.append(labels[args[0].value])
+            # RETURN continues after the CALL, which is followed below
+            if opcode not in ('JUMP', 'EXIT', 'RETURN'):
+                pending.append(index + 1)
+        return [instruction for index, instruction in enumerate(instructions) if reachable[index]]
+
+    def remove_unused_labels(self, instructions):
+        used = {args[0].value for opcode, order, args in instructions if opcode in self.parser.jump_opcodes}
+        return [(opcode, order, args) for opcode, order, args in instructions
+                if opcode != 'LABEL' or args[0].value in used]
+
+    def remove_unused_variables(self, instructions):
+        # operands are shared, so every use of a variable is the same object
+        used = set()
+        for opcode, order, args in instructions:
+            if opcode != 'DEFVAR':
+                used.update(arg for arg in args if arg.is_var)
+        # DEFVAR in LF or TF fails without the frame, so only global variables are dropped
+        return [(opcode, order, args) for opcode, order, args in instructions
+                if opcode != 'DEFVAR' or args[0].frame != 'GF' or args[0] in used]
+
+    # Type inference. The types of global variables are propagated over the control flow graph of the
+    # program. Instructions whose operand types are known on every path get a handler without the
+    # type checks, all other instructions keep the checked one.
+
+    def infer_types(self):
+        program = self.program
+        length = len(program)
+        instructions = [(program.opcode(index), program.args(index)) for index in range(length)]
+        return_sites = [index + 1 for index, (opcode, args) in enumerate(instructions) if opcode == 'CALL']
+
+        # states[index] maps global variable operands to their type before the instruction,
+        # variables that are not in the map can have any type, None means not reached yet
+        states = [None] * length
+        if length:
+            states[0] = {}
+        pending = [0] if length else []
+        while pending:
+            index = pending.pop()
+            opcode, args = instructions[index]
+            state = self.transfer_types(opcode, args, states[index])
+            for successor in self.successors(index, opcode, args, return_sites):
+                if successor >= length:
+                    continue
+                previous = states[successor]
+                if previous is None:
+                    states[successor] = state
                 else:
-                    self.defined_labels.append(label.value)
-
-            elif instruction.opcode == 'JUMP':
-                found = False
-                label = self.find_arg(instruction.args[0])
-                label_string = label.value
-                # find the instruction with the matching label
-                for i in range(0, len(self.parser.instructions)):
-                    if self.parser.instructions[i].opcode == 'LABEL' and self.parser.instructions[i].args[
-                        0].value == label_string:
-                        found = True
-                        instruction_pointer = i
-                        break
-                if not found:
+                    joined = {var: arg_type for var, arg_type in previous.items() if state.get(var) == arg_type}
+                    if len(joined) == len(previous):
+                        continue
+                    states[successor] = joined
+                pending.append(successor)
+
+        specializations = {
+            'ADD': self.specialize_arithmetic,
+            'SUB': self.specialize_arithmetic,
+            'MUL': self.specialize_arithmetic,
+            'IDIV': self.specialize_arithmetic,
+            'DIV': self.specialize_arithmetic,
+            'LT': self.specialize_relational,
+            'GT': self.specialize_relational,
+            'EQ': self.specialize_relational,
+            'AND': self.specialize_logical,
+            'OR': self.specialize_logical,
+            'NOT': self.specialize_logical,
+            'CONCAT': self.specialize_concat,
+            'JUMPIFEQ': self.specialize_conditional_jump,
+            'JUMPIFNEQ': self.specialize_conditional_jump,
+        }
+        specializers = {}
+        sites = 0
+        for index, (opcode, args) in enumerate(instructions):
+            specialization = specializations.get(opcode)
+            if specialization is None or states[index] is None:
+                continue
+            sites += 1
+            types = [self.operand_type(arg, states[index]) for arg in args[1:]]
+            decoder = specialization(opcode, types)
+            if decoder is not None:
+                specializers[index] = decoder
+        self.debug_output.write("types: specialized %d of %d checked instructions\n" % (len(specializers), sites))
+        return specializers
+
+    def operand_type(self, arg, state):
+        if not arg.is_var:
+            return arg.arg_type
+        return state.get(arg)
+
+    def successors(self, index, opcode, args, return_sites):
+        if opcode in ('JUMP', 'CALL'):
+            return [self.program.labels[args[0].value]]
+        if opcode in self.parser.jump_opcodes:
+            return [self.program.labels[args[0].value], index + 1]
+        if opcode == 'RETURN':
+            # any CALL can be the one returned to
+            return return_sites
+        if opcode == 'EXIT':
+            return []
+        return [index + 1]
+
+    def transfer_types(self, opcode, args, state):
+        signature = instructions_map.instructions_map[opcode]
+        if not signature or signature[0] != instructions_map.ArgTypeEnum.VARIABLE or args[0].frame != 'GF':
+            return state
+        var = args[0]
+        types = [self.operand_type(arg, state) for arg in args[1:]]
+        if opcode == 'MOVE':
+            result = types[0]
+        elif opcode in ('ADD', 'SUB', 'MUL'):
+            result = types[0] if types[0] in ('int', 'float') else None
+        elif opcode == 'IDIV':
+            # IDIV of two floats leaves the variable as it is
+            result = 'int' if types[0] == 'int' else None
+        elif opcode == 'DIV':
+            # DIV of two ints leaves the variable as it is
+            result = 'float' if types[0] == 'float' else None
+        elif opcode in ('LT', 'GT', 'EQ', 'AND', 'OR', 'NOT'):
+            result = 'bool'
+        elif opcode in ('INT2CHAR', 'CONCAT', 'TYPE'):
+            result = 'string'
+        elif opcode in ('STRI2INT', 'FLOAT2INT'):
+            result = 'int'
+        elif opcode == 'INT2FLOAT':
+            result = 'float'
+        else:
+            result = None
+        state = dict(state)
+        if result is None:
+            state.pop(var, None)
+        else:
+            state[var] = result
+        return state
+
+    def specialize_arithmetic(self, opcode, types):
+        if types[0] != types[1] or types[0] not in ('int', 'float'):
+            return None
+        arg_type = types[0]
+        operations = self.float_operations if arg_type == 'float' else self.int_operations
+        operation = operations.get(opcode)
+        if operation is None:
+            return None
+        check_zero = opcode in ('IDIV', 'DIV')
+
+        def decoder(index, instruction):
+            var_arg, symb1_arg, symb2_arg = instruction.args
+            resolve_symb1 = self.resolver(symb1_arg)
+            resolve_symb2 = self.resolver(symb2_arg)
+            resolve_var = self.resolver(var_arg)
+
+            def handler(state):
+                value1 = resolve_symb1(state).value
+                value2 = resolve_symb2(state).value
+                var = resolve_var(state)
+                if check_zero and value2 == 0:
                     if DEBUG:
-                        print("Label not found")
-                    exit(52)
-
-            elif instruction.opcode == 'JUMPIFEQ':
-                label = self.find_arg(instruction.args[0])
-                found = False
-                label_string = label.value
-                symb1 = self.find_arg(instruction.args[1])
-                symb2 = self.find_arg(instruction.args[2])
-                if symb1.arg_type == symb2.arg_type and (symb1.arg_type != 'nil' and symb2.arg_type != 'nil'):
-                    if str(symb1.value) == str(symb2.value):
-                        for i in range(0, len(self.parser.instructions)):
-                            if self.parser.instructions[i].opcode == 'LABEL' and self.parser.instructions[i].args[
-                                0].value == label_string:
-                                found = True
-                                instruction_pointer = i
-                                break
-                        if not found:
-                            if DEBUG:
-                                print("Label not found")
-                            exit(52)
+                        print("Division by zero")
+                    exit(57)
+                var.value = operation(value1, value2)
+                var.arg_type = arg_type
+            return handler
+        return decoder
+
+    def specialize_relational(self, opcode, types):
+        if types[0] != types[1] or types[0] not in ('int', 'bool', 'string'):
+            return None
+        relational_operation = self.relational_operations[opcode]
+
+        def decoder(index, instruction):
+            var_arg, symb1_arg, symb2_arg = instruction.args
+            resolve_symb1 = self.resolver(symb1_arg)
+            resolve_symb2 = self.resolver(symb2_arg)
+            resolve_var = self.resolver(var_arg)
+
+            def handler(state):
+                value1 = resolve_symb1(state).value
+                value2 = resolve_symb2(state).value
+                var = resolve_var(state)
+                var.value = relational_operation(value1, value2)
+                var.arg_type = 'bool'
+            return handler
+        return decoder
+
+    def specialize_logical(self, opcode, types):
+        if any(arg_type != 'bool' for arg_type in types):
+            return None
+
+        def decoder(index, instruction):
+            var_arg = instruction.args[0]
+            resolvers = [self.resolver(symb_arg) for symb_arg in instruction.args[1:]]
+            resolve_var = self.resolver(var_arg)
+
+            def handler(state):
+                values = [resolve(state).value for resolve in resolvers]
+                var = resolve_var(state)
+                if opcode == 'NOT':
+                    var.value = not values[0]
+                elif opcode == 'AND':
+                    var.value = values[0] and values[1]
                 else:
-                    if DEBUG:
-                        print("Invalid type")
-                    exit(53)
-
-            elif instruction.opcode == 'JUMPIFNEQ':
-                label = self.find_arg(instruction.args[0])
-                found = False
-                label_string = label.value
-                symb1 = self.find_arg(instruction.args[1])
-                symb2 = self.find_arg(instruction.args[2])
-                if symb1.arg_type == symb2.arg_type and (symb1.arg_type != 'nil' and symb2.arg_type != 'nil'):
-                    if str(symb1.value) != str(symb2.value):
-                        for i in range(0, len(self.parser.instructions)):
-                            if self.parser.instructions[i].opcode == 'LABEL' and self.parser.instructions[i].args[
-                                0].value == label_string:
-                                found = True
-                                instruction_pointer = i
-                                break
-                        if not found:
-                            if DEBUG:
-                                print("Label not found")
-                            exit(52)
+                    var.value = values[0] or values[1]
+                var.arg_type = 'bool'
+            return handler
+        return decoder
+
+    def specialize_concat(self, opcode, types):
+        if types != ['string', 'string']:
+            return None
+
+        def decoder(index, instruction):
+            var_arg, symb1_arg, symb2_arg = instruction.args
+            resolve_var = self.resolver(var_arg)
+            resolve_symb1 = self.resolver(symb1_arg)
+            resolve_symb2 = self.resolver(symb2_arg)
+
+            def handler(state):
+                var = resolve_var(state)
+                symb1 = resolve_symb1(state)
+                text = resolve_symb2(state).value
+                if var is symb1:
+                    var.append(text)
                 else:
-                    if DEBUG:
-                        print("Invalid type")
-                    exit(53)
-
+                    var.value = symb1.value + text
+                    var.arg_type = 'string'
+            return handler
+        return decoder
+
+    def specialize_conditional_jump(self, opcode, types):
+        if types[0] != types[1] or types[0] in (None, 'nil'):
+            return None
+        jump_if_equal = opcode == 'JUMPIFEQ'
+
+        def decoder(index, instruction):
+            label_arg, symb1_arg, symb2_arg = instruction.args
+            target = self.program.labels[label_arg.value] + 1
+            resolve_symb1 = self.resolver(symb1_arg)
+            resolve_symb2 = self.resolver(symb2_arg)
+
+            def handler(state):
+                if (resolve_symb1(state).value == resolve_symb2(state).value) == jump_if_equal:
+                    return target
+            return handler
+        return decoder
+
+    # Superinstructions. A fused handler replaces the handler of the first instruction of a sequence
+    # and continues after the last one. Handlers of the other instructions are kept, so instruction
+    # indexes, labels and return addresses do not change.
+
+    def fuse_instructions(self):
+        index = 0
+        while index < len(self.program):
+            fused = (self.fuse_compare_and_jump(index) or self.fuse_stack_arithmetic(index)
+                     or self.fuse_moves(index))
+            if fused is None:
+                index += 1
+                continue
+            handler, length = fused
+            self.code[index] = handler
+            index += length
+
+    def match_opcodes(self, index, *opcodes):
+        program = self.program
+        if index + len(opcodes) > len(program):
+            return False
+        for offset, allowed in enumerate(opcodes):
+            if program.opcode(index + offset) not in allowed:
+                return False
+        return True
 
+    def fuse_compare_and_jump(self, index):
+        # LT/GT/EQ tmp a b + JUMPIFEQ/JUMPIFNEQ label tmp bool@literal
+        if not self.match_opcodes(index, ('LT', 'GT', 'EQ'), ('JUMPIFEQ', 'JUMPIFNEQ')):
+            return None
+        program = self.program
+        opcode = program.opcode(index)
+        var_arg, symb1_arg, symb2_arg = program.args(index)
+        label_arg, left, right = program.args(index + 1)
+        if left is var_arg and not right.is_var and right.arg_type == 'bool':
+            literal = right.value
+        elif right is var_arg and not left.is_var and left.arg_type == 'bool':
+            literal = left.value
+        else:
+            return None
+        relational_operation = self.relational_operations[opcode]
+        target = program.labels[label_arg.value] + 1
+        jump_if_equal = program.opcode(index + 1) == 'JUMPIFEQ'
+        after = index + 2
+        resolve_var = self.resolver(var_arg)
+        resolve_symb1 = self.resolver(symb1_arg)
+        resolve_symb2 = self.resolver(symb2_arg)
+
+        def handler(state):
+            symb1 = resolve_symb1(state)
+            symb2 = resolve_symb2(state)
+            state.check_relational(symb1, symb2)
+            var = resolve_var(state)
+            if symb1.arg_type == 'nil' or symb2.arg_type == 'nil':
+                if opcode != 'EQ':
+                    exit(53)
+                result = symb1.arg_type == symb2.arg_type
+            else:
+                result = relational_operation(symb1.value, symb2.value)
+            state.set_var(var, result, 'bool')
+            if (result == literal) == jump_if_equal:
+                return target
+            return after
+        return handler, 2
+
+    def fuse_stack_arithmetic(self, index):
+        # PUSHS a + PUSHS b + ADDS/SUBS/MULS/IDIVS + POPS var
+        if not self.match_opcodes(index, ('PUSHS',), ('PUSHS',), ('ADDS', 'SUBS', 'MULS', 'IDIVS'), ('POPS',)):
+            return None
+        program = self.program
+        opcode = program.opcode(index + 2)[:-1]
+        int_operation = self.int_operations.get(opcode)
+        float_operation = self.float_operations.get(opcode)
+        after = index + 4
+        resolve_symb1 = self.resolver(program.args(index)[0])
+        resolve_symb2 = self.resolver(program.args(index + 1)[0])
+        resolve_var = self.resolver(program.args(index + 3)[0])
+
+        def handler(state):
+            symb1 = resolve_symb1(state)
+            symb2 = resolve_symb2(state)
+            type1 = symb1.arg_type
+            if type1 != symb2.arg_type:
+                if DEBUG:
+                    print("Invalid types for arithmetic operation")
+                exit(53)
+            if type1 == 'int':
+                operation = int_operation
+            elif type1 == 'float':
+                operation = float_operation
+            else:
+                operation = None
+            if operation is None:
+                if DEBUG:
+                    print("Invalid types for arithmetic operation")
+                exit(53)
+            if opcode == 'IDIV' and symb2.value == 0:
+                if DEBUG:
+                    print("Division by zero")
+                exit(57)
+            state.set_var(resolve_var(state), operation(symb1.value, symb2.value), type1)
+            return after
+        return handler, 4
+
+    def fuse_moves(self, index):
+        # MOVE t1 a + MOVE t2 t1 + MOVE t3 t2 ...
+        program = self.program
+        if not self.match_opcodes(index, ('MOVE',), ('MOVE',)):
+            return None
+        destination, source_arg = program.args(index)
+        destinations = [destination]
+        while self.match_opcodes(index + len(destinations), ('MOVE',)):
+            next_destination, next_source = program.args(index + len(destinations))
+            if next_source is not destinations[-1]:
+                break
+            destinations.append(next_destination)
+        if len(destinations) < 2:
+            return None
+        after = index + len(destinations)
+        resolve_first = self.resolver(destinations[0])
+        resolve_rest = [self.resolver(destination) for destination in destinations[1:]]
+        resolve_source = self.resolver(source_arg)
+
+        def handler(state):
+            var = resolve_first(state)
+            symb = resolve_source(state)
+            value = symb.value
+            arg_type = symb.arg_type
+            state.set_var(var, value, arg_type)
+            for resolve in resolve_rest:
+                state.set_var(resolve(state), value, arg_type)
+            return after
+        return handler, len(destinations)
 
+    def execute(self):
+        if DEBUG:
+            print("Executing instructions")
 
+        self.decode()
+        try:
+            if self.trace_size:
+                self.run_traced()
+            elif self.profile:
+                self.run_profiled()
+            elif self.engine == 'compiled':
+                self.run_compiled()
+            else:
+                self.run()
+        finally:
+            if self.call_profiler is not None:
+                self.call_profiler.finish()
+                self.call_profiler.report(self.debug_output)
+                self.call_profiler.dump(self.call_profile)
 
-            elif instruction.opcode == 'INT2FLOAT':
-                var = self.find_arg(instruction.args[0])
-                symb = self.find_arg(instruction.args[1])
-                if symb.arg_type == 'int':
-                    self.set_var(var, float.hex(float(int(symb.value))), 'float')
-                elif symb.arg_type is None:
-                    if DEBUG:
-                        print("Invalid type2 for int2float")
-                    exit(56)
+        # print the defined variables
+        if DEBUG:
+            self.global_frame.print_all_vars()
+
+
+    def profile_calls(self):
+        # only CALL and RETURN are wrapped, the other handlers run as they are
+        program = self.program
+        profiler = self.call_profiler = CallProfiler()
+        enter = profiler.enter
+        leave = profiler.leave
+        for index in range(len(program)):
+            opcode = program.opcode(index)
+            call = self.code[index]
+            if opcode == 'CALL':
+                label = program.args(index)[0].value
+
+                def handler(state, call=call, label=label):
+                    enter(label)
+                    return call(state)
+            elif opcode == 'RETURN':
+                def handler(state, call=call):
+                    target = call(state)
+                    leave()
+                    return target
+            else:
+                continue
+            self.code[index] = handler
+        profiler.start()
+
+    def run(self):
+        code = self.code
+        length = len(code)
+        instruction_pointer = 0
+        while instruction_pointer < length:
+            target = code[instruction_pointer](self)
+            if target is None:
+                instruction_pointer += 1
+            else:
+                instruction_pointer = target
+
+    def run_profiled(self):
+        # same as run, but every handler is counted and timed
+        code = self.code
+        length = len(code)
+        counts = [0] * length
+        times = [0.0] * length
+        clock = time.perf_counter
+        instruction_pointer = 0
+        start = None
+        try:
+            while instruction_pointer < length:
+                current = instruction_pointer
+                counts[current] += 1
+                start = clock()
+                target = code[current](self)
+                times[current] += clock() - start
+                start = None
+                if target is None:
+                    instruction_pointer += 1
                 else:
-                    if DEBUG:
-                        print("Invalid type for int2float")
-                    exit(53)
-
-            elif instruction.opcode == 'FLOAT2INT':
-                var = self.find_arg(instruction.args[0])
-                symb = self.find_arg(instruction.args[1])
-                if symb.arg_type == 'float':
-                    self.set_var(var, int(float.fromhex(symb.value)), 'int')
-                elif symb.arg_type is None:
-                    if DEBUG:
-                        print("Invalid type2 for float2int")
-                    exit(56)
+                    instruction_pointer = target
+        finally:
+            # the instruction that ended the program with EXIT or an error
+            if start is not None:
+                times[current] += clock() - start
+            profiler = Profiler(self.program, counts, times)
+            profiler.report(self.debug_output)
+            profiler.dump(self.profile)
+
+
+    def run_traced(self):
+        # same as run, but the last executed instructions are kept in a ring buffer
+        code = self.code
+        length = len(code)
+        trace = Trace(self.trace_size)
+        operands = [trace.prepare(self.program.args(index)) for index in range(length)]
+        record = trace.record
+        peek_variable = self.peek_variable
+        instruction_pointer = 0
+        exit_code = None
+        try:
+            while instruction_pointer < length:
+                record(instruction_pointer, operands[instruction_pointer], peek_variable)
+                target = code[instruction_pointer](self)
+                if target is None:
+                    instruction_pointer += 1
                 else:
-                    if DEBUG:
-                        print("Invalid type for float2int")
-                        print(symb.arg_type)
-                        print(symb.big_type)
-                    exit(53)
+                    instruction_pointer = target
+        except SystemExit as error:
+            exit_code = error.code or 0
+            raise
+        except BaseException:
+            exit_code = -1
+            raise
+        finally:
+            # EXIT can end the program with 0-49, anything else is an error of the program
+            if exit_code is not None and not 0 <= exit_code <= 49:
+                trace.dump(self.trace_file, self.program, exit_code)
+
+    def run_compiled(self):
+        # the program runs as a Python function made by Compiler, cached with the validated programs
+        cache = ProgramCache(self.cache_dir) if self.cache_dir else None
+        code = None
+        if cache is not None:
+            key = cache.code_key(self.program)
+            code = cache.load(key)
+        if not isinstance(code, CodeType):
+            code = compile(Compiler(self.program).source(), '<IPPcode23>', 'exec')
+            if cache is not None:
+                cache.store(key, code)
+        namespace = {}
+        exec(code, namespace)
+        # global variables not defined yet, no type check of the compiled code accepts it
+        undefined = Variable('')
+        undefined.arg_type = 'undefined'
+        namespace['run'](self, self.code, self.program.constants, undefined)
+
+    def define_global(self, name):
+        # DEFVAR of a global variable in the compiled code
+        variable = self.global_frame.variables.get(name)
+        if variable is None:
+            variable = self.global_frame.variables[name] = Variable(name)
+        return variable
+
+    def peek_variable(self, operand):
+        # the variable of an operand, or None, without failing when it or its frame does not exist
+        if operand.frame == 'GF':
+            frame = self.global_frame
+        elif operand.frame == 'LF':
+            frame = self.frames_stack[-1] if self.frames_stack else None
+        else:
+            frame = self.temporary_frame
+        if frame is None:
+            return None
+        return frame.variables.get(operand.name)
+
+
+class Trace:
+    # Ring buffer of the last executed instructions, allocated once. Every entry is the instruction
+    # index and the variable operands, each stored as a kind and 8 bytes of its value at that moment.
+    # Strings longer than 8 bytes are cut.
+    magic = b'IPPT'
+    version = 1
+    header = struct.Struct('<4sBIIQi')
+    entry = struct.Struct('<qqB' + 'B8s' * 3)
+    operand_slots = 3
+    pack_int = struct.Struct('<q').pack_into
+    kinds = {'int': 1, 'float': 2, 'bool': 3, 'nil': 4, 'string': 5, 'label': 8, 'type': 8}
+    # 0 no operand, 6 uninitialized variable, 7 undefined variable or frame, 9 int out of 64 bits,
+    # 10 string cut to 8 bytes
+    kind_names = {0: '', 1: 'int', 2: 'float', 3: 'bool', 4: 'nil', 5: 'string', 6: 'uninitialized',
+                  7: 'undefined', 8: 'name', 9: 'int', 10: 'string'}
+
+    def __init__(self, size):
+        self.size = size
+        self.indexes = array('q', bytes(8 * size))
+        self.operand_kinds = bytearray(size * self.operand_slots)
+        self.operand_values = bytearray(size * self.operand_slots * 8)
+        self.position = 0
+        self.total = 0
+
+    def prepare(self, operands):
+        # only variables are recorded, literal operands are taken from the program when dumping
+        return [(number, operand) for number, operand in enumerate(operands) if operand.is_var]
+
+    def record(self, index, variables, peek_variable):
+        position = self.position
+        self.indexes[position] = index
+        slot = position * self.operand_slots
+        kinds = self.operand_kinds
+        for number, operand in variables:
+            variable = peek_variable(operand)
+            if variable is None:
+                kinds[slot + number] = 7
+            elif variable.arg_type is None:
+                kinds[slot + number] = 6
+            else:
+                # only the start of a string is kept, so only that much of it is read
+                value = variable.prefix(9) if variable.arg_type == 'string' else variable.value
+                kinds[slot + number] = self.store_value(self.operand_values, (slot + number) * 8,
+                                                        variable.arg_type, value)
+        self.position = position + 1 if position + 1 < self.size else 0
+        self.total += 1
+
+    def store_value(self, values, offset, arg_type, value):
+        kind = self.kinds[arg_type]
+        if kind == 1:
+            if not -(1 << 63) <= value < (1 << 63):
+                return 9
+            self.pack_int(values, offset, value)
+        elif kind == 3:
+            self.pack_int(values, offset, value)
+        elif kind == 2:
+            struct.pack_into('<d', values, offset, value)
+        elif kind == 5 or kind == 8:
+            encoded = value[:8].encode('utf-8', 'surrogatepass')
+            struct.pack_into('8s', values, offset, encoded)
+            if len(value) > 8 or len(encoded) > 8:
+                return 10
+        return kind
+
+    def entries(self):
+        # positions of the recorded entries, oldest first
+        if self.total < self.size:
+            return range(self.total)
+        return list(range(self.position, self.size)) + list(range(self.position))
+
+    def dump(self, path, program, exit_code):
+        positions = self.entries()
+        try:
+            with open(path, 'wb') as file:
+                file.write(self.header.pack(self.magic, self.version, self.size, len(positions), self.total,
+                                            exit_code))
+                for position in positions:
+                    index = self.indexes[position]
+                    args = program.args(index)
+                    operands = []
+                    for number in range(self.operand_slots):
+                        slot = position * self.operand_slots + number
+                        if number >= len(args):
+                            kind, payload = 0, bytes(8)
+                        elif args[number].is_var:
+                            kind = self.operand_kinds[slot]
+                            payload = bytes(self.operand_values[slot * 8:slot * 8 + 8])
+                        else:
+                            payload = bytearray(8)
+                            kind = self.store_value(payload, 0, args[number].arg_type, args[number].value)
+                        operands.append(kind)
+                        operands.append(bytes(payload))
+                    file.write(self.entry.pack(index, program.orders[index], program.opcodes[index], *operands))
+        except OSError:
+            if DEBUG:
+                print("Trace file cannot be opened")
+
+    @classmethod
+    def load(cls, file):
+        magic, version, size, count, total, exit_code = cls.header.unpack(file.read(cls.header.size))
+        if magic != cls.magic or version != cls.version:
+            raise ValueError("not a trace file")
+        entries = [cls.entry.unpack(file.read(cls.entry.size)) for _ in range(count)]
+        return total, exit_code, entries
+
+    @classmethod
+    def operand_value(cls, kind, payload):
+        if kind in (1, 3):
+            value = struct.unpack('<q', payload)[0]
+            return str(value) if kind == 1 else ('true' if value else 'false')
+        if kind == 2:
+            return struct.unpack('<d', payload)[0].hex()
+        if kind == 4:
+            return 'nil'
+        if kind == 8:
+            return payload.rstrip(b'\0').decode('utf-8', 'replace')
+        if kind in (5, 10):
+            text = Parser.escape_string(payload.rstrip(b'\0').decode('utf-8', 'replace'))
+            return text + '...' if kind == 10 else text
+        if kind == 9:
+            return '?'
+        return ''
+
+
+class Profiler:
+    # execution counts and times of the instructions, summed up per opcode and per source order
+    report_size = 20
+
+    def __init__(self, program, counts, times):
+        self.instructions = [(program.orders[index], program.opcode(index), counts[index], times[index])
+                             for index in range(len(program)) if counts[index]]
+        self.instructions.sort(key=lambda instruction: instruction[3], reverse=True)
+        self.opcodes = {}
+        for order, opcode, count, elapsed in self.instructions:
+            total_count, total_time = self.opcodes.get(opcode, (0, 0.0))
+            self.opcodes[opcode] = (total_count + count, total_time + elapsed)
+        self.count = sum(count for count, elapsed in self.opcodes.values())
+        self.time = sum(elapsed for count, elapsed in self.opcodes.values())
+
+    def report(self, output):
+        write = output.write
+        total = self.time or 1.0
+        write("profile: %d instructions executed in %.6f s\n" % (self.count, self.time))
+        write("%-12s %12s %12s %7s\n" % ("opcode", "count", "time [s]", "time %"))
+        for opcode, (count, elapsed) in sorted(self.opcodes.items(), key=lambda item: item[1][1], reverse=True):
+            write("%-12s %12d %12.6f %7.2f\n" % (opcode, count, elapsed, 100 * elapsed / total))
+        write("%-12s %-12s %12s %12s %7s\n" % ("order", "opcode", "count", "time [s]", "time %"))
+        for order, opcode, count, elapsed in self.instructions[:self.report_size]:
+            write("%-12d %-12s %12d %12.6f %7.2f\n" % (order, opcode, count, elapsed, 100 * elapsed / total))
+
+    def dump(self, path):
+        data = {
+            'count': self.count,
+            'time': self.time,
+            'opcodes': {opcode: {'count': count, 'time': elapsed}
+                        for opcode, (count, elapsed) in self.opcodes.items()},
+            'instructions': [{'order': order, 'opcode': opcode, 'count': count, 'time': elapsed}
+                             for order, opcode, count, elapsed in self.instructions],
+        }
+        try:
+            with open(path, 'w') as file:
+                json.dump(data, file, indent=1)
+        except OSError:
+            if DEBUG:
+                print("Profile file cannot be opened")
+            sys.exit(12)
 
-            elif instruction.opcode == 'CONCAT':
-                var = self.find_arg(instruction.args[0])
-                symb1 = self.find_arg(instruction.args[1])
-                symb2 = self.find_arg(instruction.args[2])
-                if symb1.arg_type == 'string' and symb2.arg_type == 'string':
-                    self.set_var(var, symb1.value + symb2.value, 'string')
-                else:
-                    if DEBUG:
-                        print("Invalid type for concat")
-                    exit(53)
 
+class CallProfiler:
+    # Time spent in subroutines. Every active call has a path, the chain of labels from the start
+    # of the program, and the exclusive time of a call is added to its path for the folded output.
+    # A recursive label gets its inclusive time only from the outermost call.
+    root = 'main'
 
-            elif instruction.opcode == 'WRITE':
-                symb = self.find_arg(instruction.args[0])
-                if symb.value == 'nil':
-                    print('', end='')
-                elif symb.arg_type == 'float':
-                    if symb.value == '' or symb.value.isspace():
-                        print('', end='')
+    def __init__(self):
+        self.clock = time.perf_counter
+        # path number -> (parent path number, label), paths[(parent, label)] -> path number
+        self.path_labels = []
+        self.paths = {}
+        self.path_times = []
+        # active calls as [path number, label, start time, time spent in the called subroutines]
+        self.calls = []
+        self.active = {}
+        self.counts = {}
+        self.inclusive = {}
+        self.exclusive = {}
+
+    def start(self):
+        self.enter(self.root)
+
+    def enter(self, label):
+        parent = self.calls[-1][0] if self.calls else -1
+        path = self.paths.get((parent, label))
+        if path is None:
+            path = self.paths[(parent, label)] = len(self.path_labels)
+            self.path_labels.append((parent, label))
+            self.path_times.append(0.0)
+        self.counts[label] = self.counts.get(label, 0) + 1
+        self.active[label] = self.active.get(label, 0) + 1
+        self.calls.append([path, label, self.clock(), 0.0])
+
+    def leave(self):
+        now = self.clock()
+        path, label, start, children = self.calls.pop()
+        elapsed = now - start
+        self.path_times[path] += elapsed - children
+        self.exclusive[label] = self.exclusive.get(label, 0.0) + elapsed - children
+        self.active[label] -= 1
+        if self.active[label] == 0:
+            self.inclusive[label] = self.inclusive.get(label, 0.0) + elapsed
+        if self.calls:
+            self.calls[-1][3] += elapsed
+
+    def finish(self):
+        # subroutines that did not return before the program ended
+        while self.calls:
+            self.leave()
+
+    def path_name(self, path):
+        labels = []
+        while path != -1:
+            path, label = self.path_labels[path]
+            labels.append(label)
+        return ';'.join(reversed(labels))
+
+    def report(self, output):
+        write = output.write
+        write("%-24s %10s %14s %14s\n" % ("label", "calls", "inclusive [s]", "exclusive [s]"))
+        for label, inclusive in sorted(self.inclusive.items(), key=lambda item: item[1], reverse=True):
+            write("%-24s %10d %14.6f %14.6f\n" % (label, self.counts[label], inclusive, self.exclusive[label]))
+
+    def dump(self, path):
+        # folded stacks with the exclusive time in microseconds, as expected by flamegraph tools
+        try:
+            with open(path, 'w') as file:
+                for number, elapsed in enumerate(self.path_times):
+                    microseconds = round(elapsed * 1e6)
+                    if microseconds:
+                        file.write("%s %d\n" % (self.path_name(number), microseconds))
+        except OSError:
+            if DEBUG:
+                print("Call profile file cannot be opened")
+            sys.exit(12)
+
+
+class Compiler:
+    # Translates a decoded program to the source of one Python function. Basic blocks are branches of
+    # a binary if tree on the number of the block, a jump sets the number of the next block, and a
+    # block jumping back to itself runs in a loop of its own. Global variables are locals holding
+    # their Variable. Only the common well typed cases are written out, every other case calls the
+    # decoded handler of the instruction, so the errors and exit codes are those of the handlers.
+    # Blocks outside of loops run at most once and just call their handlers, which keeps the code of
+    # huge straight programs small.
+    arithmetic_operators = {'ADD': '+', 'SUB': '-', 'MUL': '*', 'IDIV': '//', 'DIV': '/'}
+    relational_operators = {'LT': '<', 'GT': '>', 'EQ': '=='}
+    comparable_types = ('int', 'bool', 'string')
+    equality_types = ('int', 'bool', 'string', 'float')
+    # instructions after which a new block starts
+    block_ends = ('JUMP', 'JUMPIFEQ', 'JUMPIFNEQ', 'JUMPIFEQS', 'JUMPIFNEQS', 'CALL', 'RETURN', 'EXIT', 'LABEL')
+
+    def __init__(self, program):
+        self.program = program
+        self.operand_numbers = {id(operand): number for number, operand in enumerate(program.constants)}
+        # locals bound before the dispatch loop, by name
+        self.bindings = {}
+        self.global_names = {}
+        self.block_numbers = {}
+        self.block = 0
+        self.in_loop = False
+        # global operands of the instruction not checked yet, in the order the handler resolves them
+        self.unchecked = []
+        self.index = 0
+
+    @staticmethod
+    def indent(lines):
+        return ['    ' + line for line in lines]
+
+    def source(self):
+        program = self.program
+        length = len(program)
+        starts = [0] if length else []
+        for index in range(length - 1):
+            if program.opcode(index) in self.block_ends:
+                starts.append(index + 1)
+        starts = sorted(set(starts))
+        # the end of the program is a block of its own, RETURN can continue there
+        self.block_numbers = {start: number for number, start in enumerate(starts)}
+        self.block_numbers[length] = len(starts)
+        ranges = list(zip(starts, starts[1:] + [length]))
+        hot = self.loop_blocks(ranges)
+        blocks = [self.compile_block(start, end) if number in hot else self.compile_cold_block(start, end)
+                  for number, (start, end) in enumerate(ranges)]
+        blocks.append(['return'])
+        tree = self.dispatch(blocks, 0, len(blocks) - 1)
+
+        lines = ['def run(state, code, constants, undefined):',
+                 '    resolver = state.resolver',
+                 '    define_global = state.define_global',
+                 '    write = state.output.write',
+                 '    labels = state.labels']
+        lines += [f'    {name} = {expression}' for name, expression in self.bindings.items()]
+        lines += [f'    {name} = undefined' for name in self.global_names.values()]
+        lines += ['    block = 0', '    while True:']
+        lines += self.indent(self.indent(tree))
+        return '\n'.join(lines) + '\n'
+
+    def successors(self, start, end):
+        # blocks the block can continue with, RETURN can continue after any CALL
+        program = self.program
+        opcode = program.opcode(end - 1)
+        successors = []
+        if opcode not in ('JUMP', 'RETURN', 'EXIT'):
+            successors.append(self.block_numbers[end])
+        if opcode in ('JUMP', 'JUMPIFEQ', 'JUMPIFNEQ', 'JUMPIFEQS', 'JUMPIFNEQS', 'CALL'):
+            successors.append(self.block_numbers[self.target(program.args(end - 1)[0])])
+        elif opcode == 'RETURN':
+            successors += [number for block_start, number in self.block_numbers.items()
+                           if block_start > 0 and program.opcode(block_start - 1) == 'CALL']
+        return successors
+
+    def loop_blocks(self, ranges):
+        # numbers of the blocks on a cycle, found as strongly connected components by Tarjan's algorithm
+        edges = [self.successors(start, end) for start, end in ranges] + [[]]
+        indexes = {}
+        lowlinks = {}
+        stack = []
+        on_stack = set()
+        hot = set()
+        for root in range(len(edges)):
+            if root in indexes:
+                continue
+            work = [(root, 0)]
+            while work:
+                node, position = work.pop()
+                if position == 0:
+                    indexes[node] = lowlinks[node] = len(indexes)
+                    stack.append(node)
+                    on_stack.add(node)
+                for position in range(position, len(edges[node])):
+                    successor = edges[node][position]
+                    if successor not in indexes:
+                        work += [(node, position + 1), (successor, 0)]
                         break
-                    number = float.fromhex(symb.value)
-                    hex_number = float.hex(number)
-                    print(hex_number, end='')
-
-                elif symb.arg_type == 'string':
-                    if symb.value is not None:
-                        old = symb.value
-                        new_string = old.replace("\\032"," ").replace("\\092","\\").replace("\\035","#").replace("\\010","\\n")
-                        print(str(new_string), end='')
-
-                elif symb.value is not None:
-                    print(symb.value, end='')
-
-
-
-
-
-            elif instruction.opcode == 'DPRINT':
-                symb = self.find_arg(instruction.args[0])
-                sys.stderr.write(symb.value)
-
-            instruction_pointer += 1
+                    if successor in on_stack:
+                        lowlinks[node] = min(lowlinks[node], indexes[successor])
+                else:
+                    if lowlinks[node] == indexes[node]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component.append(member)
+                            if member == node:
+                                break
+                        if len(component) > 1 or node in edges[node]:
+                            hot.update(component)
+                    if work:
+                        parent = work[-1][0]
+                        lowlinks[parent] = min(lowlinks[parent], lowlinks[node])
+        return hot
+
+    def compile_cold_block(self, start, end):
+        # the handlers are called one after another, global DEFVARs are compiled to keep the locals
+        program = self.program
+        self.block = self.block_numbers[start]
+        self.in_loop = False
+        last = end - 1 if program.opcode(end - 1) in self.block_ends else end
+        lines = []
+        first = start
+        for index in range(start, last):
+            if program.opcode(index) == 'DEFVAR' and program.args(index)[0].frame == 'GF':
+                lines += self.call_handlers(first, index)
+                lines += self.compile_defvar(index, 'DEFVAR', program.args(index))
+                first = index + 1
+        lines += self.call_handlers(first, last)
+        if last < end:
+            self.index = last
+            self.unchecked = []
+            opcode = program.opcode(last)
+            compile_instruction = getattr(self, 'compile_' + opcode.lower(), self.compile_call_handler)
+            lines += compile_instruction(last, opcode, program.args(last))
+        if program.opcode(end - 1) not in ('JUMP', 'RETURN'):
+            lines += self.goto(end)
+        return lines
+
+    def call_handlers(self, first, last):
+        if last - first <= 2:
+            return [self.handler(index) for index in range(first, last)]
+        self.bindings[f's{first}'] = f'code[{first}:{last}]'
+        return [f'for handler in s{first}:', '    handler(state)']
+
+    def dispatch(self, blocks, first, last):
+        if first == last:
+            return blocks[first]
+        middle = (first + last + 1) // 2
+        return [f'if block < {middle}:', *self.indent(self.dispatch(blocks, first, middle - 1)),
+                'else:', *self.indent(self.dispatch(blocks, middle, last))]
+
+    def compile_block(self, start, end):
+        program = self.program
+        self.block = self.block_numbers[start]
+        labels = program.labels
+        self.in_loop = any(program.opcode(index) in ('JUMP', 'JUMPIFEQ', 'JUMPIFNEQ', 'JUMPIFEQS', 'JUMPIFNEQS')
+                           and labels[program.args(index)[0].value] + 1 == start for index in range(start, end))
+        lines = []
+        for index in range(start, end):
+            opcode = program.opcode(index)
+            self.index = index
+            self.unchecked = []
+            compile_instruction = getattr(self, 'compile_' + opcode.lower(), self.compile_call_handler)
+            lines += compile_instruction(index, opcode, program.args(index))
+        if program.opcode(end - 1) not in ('JUMP', 'RETURN'):
+            lines += self.goto(end)
+        if self.in_loop:
+            return ['while True:', *self.indent(lines)]
+        return lines
+
+    def goto(self, index):
+        # lines continuing with the instruction at index
+        number = self.block_numbers[index]
+        if number == len(self.block_numbers) - 1:
+            return ['return']
+        if self.in_loop:
+            if number == self.block:
+                return ['continue']
+            return [f'block = {number}', 'break']
+        return [f'block = {number}', 'continue']
+
+    def target(self, label_operand):
+        return self.program.labels[label_operand.value] + 1
+
+    def handler(self, index):
+        name = f'h{index}'
+        self.bindings[name] = f'code[{index}]'
+        return f'{name}(state)'
+
+    def literal(self, operand):
+        number = self.operand_numbers[id(operand)]
+        self.bindings[f'k{number}'] = f'constants[{number}].value'
+        return f'k{number}'
+
+    def global_name(self, name):
+        if name not in self.global_names:
+            self.global_names[name] = f'g{len(self.global_names)}'
+        return self.global_names[name]
+
+    def load(self, operand, name):
+        # returns the lines resolving a variable operand and the expression of its Variable, which is
+        # None for a literal
+        if not operand.is_var:
+            return [], None
+        if operand.frame == 'GF':
+            self.unchecked.append(self.global_name(operand.name))
+            return [], self.global_name(operand.name)
+        # an undefined global variable resolved before this one is the error of the instruction
+        lines = []
+        for global_name in self.unchecked:
+            lines += [f'if {global_name} is undefined:', f'    {self.handler(self.index)}']
+        self.unchecked = []
+        number = self.operand_numbers[id(operand)]
+        self.bindings[f'r{number}'] = f'resolver(constants[{number}])'
+        return lines + [f'{name} = r{number}(state)'], name
+
+    def value(self, operand, variable):
+        return self.literal(operand) if variable is None else f'{variable}.value'
+
+    def has_type(self, operand, variable, arg_type):
+        # condition of the operand having the type, True or False when it is a literal
+        if variable is None:
+            return operand.arg_type == arg_type
+        return f"{variable}.arg_type == '{arg_type}'"
+
+    def same_type(self, operands, variables, allowed):
+        # conditions of both operands having the same type, one of the allowed ones
+        for operand, variable in zip(operands, variables):
+            if variable is None:
+                if operand.arg_type not in allowed:
+                    return [False]
+                return [self.has_type(other, other_variable, operand.arg_type)
+                        for other, other_variable in zip(operands, variables)]
+        return [f'{variables[0]}.arg_type == {variables[1]}.arg_type', f'{variables[0]}.arg_type in {allowed!r}']
+
+    def destination(self, operand):
+        # condition of the variable existing, the lines resolving it and its expression
+        if operand.frame == 'GF':
+            name = self.global_name(operand.name)
+            return f'{name} is not undefined', [], name
+        # resolved after the type checks, which global operands do not pass while undefined
+        self.unchecked = []
+        lines, name = self.load(operand, 'variable')
+        return True, lines, name
+
+    def guarded(self, index, conditions, body, otherwise=None):
+        # the body when all conditions hold, the decoded handler otherwise
+        otherwise = otherwise or [self.handler(index)]
+        if False in conditions:
+            return otherwise
+        conditions = [condition for condition in conditions if condition is not True]
+        if not conditions:
+            return body
+        return [f"if {' and '.join(conditions)}:", *self.indent(body), 'else:', *self.indent(otherwise)]
+
+    def compile_call_handler(self, index, opcode, args):
+        return [self.handler(index)]
+
+    def compile_label(self, index, opcode, args):
+        return []
+
+    def compile_defvar(self, index, opcode, args):
+        operand = args[0]
+        if operand.frame != 'GF':
+            return [self.handler(index)]
+        name = self.global_name(operand.name)
+        return [f'if {name} is undefined:', f'    {name} = define_global({operand.name!r})']
+
+    def compile_move(self, index, opcode, args):
+        var, symb = args
+        lines, variable = self.load(var, 'variable')
+        symb_lines, symbol = self.load(symb, 'a')
+        lines += symb_lines
+        conditions = []
+        if var.frame == 'GF':
+            conditions.append(f'{variable} is not undefined')
+        if symbol is not None and symb.frame == 'GF':
+            conditions.append(f'{symbol} is not undefined')
+        arg_type = repr(symb.arg_type) if symbol is None else f'{symbol}.arg_type'
+        body = [f'{variable}.value = {self.value(symb, symbol)}', f'{variable}.arg_type = {arg_type}']
+        return lines + self.guarded(index, conditions, body)
+
+    def compile_arithmetic(self, index, opcode, args):
+        var, symb1, symb2 = args
+        lines, first = self.load(symb1, 'a')
+        second_lines, second = self.load(symb2, 'b')
+        lines += second_lines
+        if opcode in ('IDIV', 'DIV'):
+            arg_type = 'int' if opcode == 'IDIV' else 'float'
+        else:
+            literals = [symb.arg_type for symb, variable in ((symb1, first), (symb2, second)) if variable is None]
+            arg_type = literals[0] if literals else 'int'
+            if arg_type not in ('int', 'float'):
+                return lines + [self.handler(index)]
+        exists, var_lines, variable = self.destination(var)
+        conditions = [self.has_type(symb1, first, arg_type), self.has_type(symb2, second, arg_type)]
+        if opcode in ('IDIV', 'DIV'):
+            conditions.append(symb2.value != 0 if second is None else f'{second}.value != 0')
+        body = var_lines + [
+            f'{variable}.value = {self.value(symb1, first)} {self.arithmetic_operators[opcode]} '
+            f'{self.value(symb2, second)}']
+        # a variable that is also an operand already exists and has the type
+        if var is not symb1 and var is not symb2:
+            conditions.append(exists)
+            body.append(f"{variable}.arg_type = '{arg_type}'")
+        return lines + self.guarded(index, conditions, body)
+
+    compile_add = compile_sub = compile_mul = compile_idiv = compile_div = compile_arithmetic
+
+    def compile_relational(self, index, opcode, args):
+        var, symb1, symb2 = args
+        lines, first = self.load(symb1, 'a')
+        second_lines, second = self.load(symb2, 'b')
+        lines += second_lines
+        exists, var_lines, variable = self.destination(var)
+        conditions = self.same_type((symb1, symb2), (first, second), self.comparable_types) + [exists]
+        body = var_lines + [
+            f'{variable}.value = {self.value(symb1, first)} {self.relational_operators[opcode]} '
+            f'{self.value(symb2, second)}',
+            f"{variable}.arg_type = 'bool'"]
+        return lines + self.guarded(index, conditions, body)
+
+    compile_lt = compile_gt = compile_eq = compile_relational
+
+    def compile_logical(self, index, opcode, args):
+        var, *symbols = args
+        lines = []
+        variables = []
+        for symb, name in zip(symbols, ('a', 'b')):
+            symb_lines, variable = self.load(symb, name)
+            lines += symb_lines
+            variables.append(variable)
+        exists, var_lines, variable = self.destination(var)
+        conditions = [self.has_type(symb, symbol, 'bool') for symb, symbol in zip(symbols, variables)] + [exists]
+        values = [self.value(symb, symbol) for symb, symbol in zip(symbols, variables)]
+        if opcode == 'NOT':
+            result = f'not {values[0]}'
+        else:
+            result = f' {opcode.lower()} '.join(values)
+        body = var_lines + [f'{variable}.value = {result}', f"{variable}.arg_type = 'bool'"]
+        return lines + self.guarded(index, conditions, body)
+
+    compile_and = compile_or = compile_not = compile_logical
+
+    def compile_concat(self, index, opcode, args):
+        var, symb1, symb2 = args
+        # the variable is resolved first, as by the handler
+        lines, variable = self.load(var, 'variable')
+        first_lines, first = self.load(symb1, 'a')
+        second_lines, second = self.load(symb2, 'b')
+        lines += first_lines + second_lines
+        conditions = [self.has_type(symb1, first, 'string'), self.has_type(symb2, second, 'string')]
+        if var.frame == 'GF':
+            conditions.append(f'{variable} is not undefined')
+        if symb1 is var:
+            # appending to the variable itself, see StringBuilder
+            body = [f'text = {self.value(symb2, second)}', f'{variable}.append(text)']
+        else:
+            body = [f'{variable}.value = {self.value(symb1, first)} + {self.value(symb2, second)}',
+                    f"{variable}.arg_type = 'string'"]
+        return lines + self.guarded(index, conditions, body)
+
+    def compile_write(self, index, opcode, args):
+        symb = args[0]
+        lines, symbol = self.load(symb, 'a')
+        if symbol is None:
+            if symb.arg_type != 'string':
+                return [self.handler(index)]
+            return [f'write({self.literal(symb)})']
+        return lines + [f"if {symbol}.arg_type == 'string':", f'    write({symbol}.value)',
+                        f"elif {symbol}.arg_type == 'int':", f'    write(str({symbol}.value))',
+                        'else:', f'    {self.handler(index)}']
+
+    def compile_jump(self, index, opcode, args):
+        return self.goto(self.target(args[0]))
+
+    def compile_conditional_jump(self, index, opcode, args):
+        label, symb1, symb2 = args
+        lines, first = self.load(symb1, 'a')
+        second_lines, second = self.load(symb2, 'b')
+        lines += second_lines
+        conditions = self.same_type((symb1, symb2), (first, second), self.equality_types)
+        operator = '==' if opcode == 'JUMPIFEQ' else '!='
+        jump = self.goto(self.target(label))
+        slow = [f'if {self.handler(index)} is not None:', *self.indent(jump)]
+        if False in conditions:
+            return lines + slow
+        conditions = [condition for condition in conditions if condition is not True]
+        fast = [f'if {self.value(symb1, first)} {operator} {self.value(symb2, second)}:', *self.indent(jump)]
+        if not conditions:
+            return lines + fast
+        return lines + [f"if {' and '.join(conditions)}:", *self.indent(fast), 'el' + slow[0], *slow[1:]]
+
+    compile_jumpifeq = compile_jumpifneq = compile_conditional_jump
+
+    def compile_stack_conditional_jump(self, index, opcode, args):
+        return [f'if {self.handler(index)} is not None:', *self.indent(self.goto(self.target(args[0])))]
+
+    compile_jumpifeqs = compile_jumpifneqs = compile_stack_conditional_jump
+
+    def compile_call(self, index, opcode, args):
+        return [f'labels.append({index + 1})'] + self.goto(self.target(args[0]))
+
+    def compile_return(self, index, opcode, args):
+        # every CALL is followed by the start of a block
+        returns = {start: number for start, number in self.block_numbers.items()
+                   if start > 0 and self.program.opcode(start - 1) == 'CALL'}
+        self.bindings['returns'] = repr(returns)
+        lines = ['if not labels:', f'    {self.handler(index)}', 'block = returns[labels.pop()]']
+        return lines + ['break' if self.in_loop else 'continue']
+
+
+class ProgramCache:
+    # Validated programs are stored in the cache directory under a key made from the source and
+    # from the interpreter itself, so any change of the interpreter invalidates old entries.
+    magic = b'IPPC'
+    chunk_size = 1 << 20
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.fingerprint = self.interpreter_fingerprint()
+
+    @staticmethod
+    def interpreter_fingerprint():
+        digest = hashlib.sha256(sys.version.encode())
+        digest.update(str(marshal.version).encode())
+        for module_file in (__file__, instructions_map.__file__):
+            with open(module_file, 'rb') as file:
+                digest.update(file.read())
+        return digest.digest()
+
+    def key(self, source):
+        # returns the key of the source and a stream the source can still be parsed from
+        digest = hashlib.sha256(self.fingerprint)
+        if source.seekable():
+            position = source.tell()
+            for chunk in iter(lambda: source.read(self.chunk_size), b''):
+                digest.update(chunk)
+            source.seek(position)
+        else:
+            content = source.read()
+            digest.update(content)
+            source = io.BytesIO(content)
+        return digest.hexdigest(), source
+
+    def code_key(self, program):
+        # the compiled code of a program depends only on the loaded program
+        digest = hashlib.sha256(self.fingerprint)
+        digest.update(b'compiled')
+        digest.update(marshal.dumps(program.pack()))
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.ippc')
+
+    def load(self, key):
+        try:
+            with open(self.path(key), 'rb') as file:
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    if data[:len(self.magic)] != self.magic:
+                        return None
+                    return marshal.loads(data[len(self.magic):])
+        except (OSError, ValueError, EOFError, TypeError):
+            return None
+
+    def store(self, key, program):
+        # written to a temporary file first, so a concurrent run never sees a partial entry
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            temporary_path = '%s.%d.tmp' % (self.path(key), os.getpid())
+            with open(temporary_path, 'wb') as file:
+                file.write(self.magic)
+                marshal.dump(program, file)
+            os.replace(temporary_path, self.path(key))
+        except OSError:
+            if DEBUG:
+                print("Program cache cannot be written")
+
+
+class Server:
+    # Runs jobs sent by interpret_client.py over a Unix socket, so the interpreter starts only once.
+    # A job is the command line options, the input and either the source or the id of a program sent
+    # before. Loaded programs are kept in memory by the SHA-256 of their source. Every job runs in a
+    # forked process with its own interpreter state, so a job can not affect the server or other jobs.
+    max_programs = 128
+
+    def __init__(self, path, cache=None):
+        self.path = path
+        self.cache = cache
+        self.programs = {}
+
+    def serve_forever(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.path)
+        listener.listen(64)
+        # finished jobs are reaped by the system, the socket is removed also when the server is killed
+        signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, lambda signal_number, frame: sys.exit(0))
+        # exit() closes sys.stdin, which must not close a socket that got its descriptor
+        sys.stdin = io.StringIO()
+        try:
+            while True:
+                connection, _ = listener.accept()
+                with connection:
+                    self.handle(connection)
+        finally:
+            listener.close()
+            os.unlink(self.path)
+
+    def handle(self, connection):
+        # a failing job must never end the server
+        try:
+            self.serve_job(connection)
+        except OSError:
+            # the client went away
+            pass
+        except Exception:
+            traceback.print_exc()
 
-        # print the defined variables
-        if DEBUG:
-            for arg in self.defined_vars:
-                print("debug print:", arg.name, arg.value, arg.arg_type, arg.frame)
+    def serve_job(self, connection):
+        try:
+            header, payloads = receive_message(connection)
+        except (OSError, ValueError):
+            return
+        exit_code, program, error = self.program(header, payloads.get('source'))
+        if program is None:
+            send_message(connection, {'exit_code': exit_code}, {'stdout': b'', 'stderr': error.encode()})
+            return
+        if os.fork() == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            try:
+                exit_code, stdout, stderr = self.run(program, header.get('argv', []), payloads.get('input', b''))
+                send_message(connection, {'exit_code': exit_code, 'program': header['program']},
+                             {'stdout': stdout.encode('utf-8', 'surrogateescape'),
+                              'stderr': stderr.encode('utf-8', 'surrogateescape')})
+            finally:
+                os._exit(0)
+
+    def program(self, header, source):
+        # returns the exit code, the loaded program and the error output
+        if source is not None:
+            header['program'] = hashlib.sha256(source).hexdigest()
+        program = self.programs.get(header.get('program'))
+        if program is not None:
+            return 0, program, ''
+        if source is None:
+            return 11, None, "Unknown program, send the source\n"
+        parser = Parser()
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout = sys.stderr = output = io.StringIO()
+        try:
+            parser.load_program(io.BytesIO(source), self.cache)
+        except SystemExit as error:
+            return exit_status(error), None, output.getvalue()
+        except Exception:
+            # the loader failed, the job ends as python3 interpret.py would
+            traceback.print_exc()
+            return 1, None, output.getvalue()
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+        if len(self.programs) >= self.max_programs:
+            del self.programs[next(iter(self.programs))]
+        self.programs[header['program']] = parser.program
+        return 0, parser.program, ''
+
+    def run(self, program, argv, input_data):
+        # runs in the forked process, like main with the given options
+        sys.stdout = stdout = io.StringIO()
+        sys.stderr = stderr = io.StringIO()
+        parser = Parser()
+        parser.program = program
+        try:
+            args = parser.parse_options(argv)
+            args.input = io.TextIOWrapper(io.BytesIO(input_data), encoding='utf-8')
+            args.output = stdout
+            interpret(parser, args)
+            exit_code = 0
+        except SystemExit as error:
+            exit_code = exit_status(error)
+        except Exception:
+            traceback.print_exc()
+            exit_code = 1
+        return exit_code, stdout.getvalue(), stderr.getvalue()
+
+
+class Batch:
+    # Runs the entries of a JSON Lines manifest one after another in this process. Every line is an
+    # object with the "source", "output" and "rc" paths and an optional "input" path, relative paths
+    # start in the directory of the manifest. Every distinct source is loaded once and every entry
+    # runs in its own interpreter, so frames and stacks are fresh. The other command line options
+    # apply to every entry.
+    def __init__(self, path, options, cache=None):
+        self.path = path
+        self.options = options
+        self.cache = cache
+        self.programs = {}
+
+    def read_manifest(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            with open(self.path, encoding='utf-8') as file:
+                lines = file.readlines()
+        except OSError:
+            if DEBUG:
+                print("Manifest cannot be opened")
+            sys.exit(11)
+        entries = []
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+                paths = {name: os.path.join(directory, entry[name]) for name in ('source', 'output', 'rc')}
+                if entry.get('input') is not None:
+                    paths['input'] = os.path.join(directory, entry['input'])
+            except (ValueError, KeyError, TypeError, AttributeError):
+                if DEBUG:
+                    print("Invalid manifest entry on line", number)
+                sys.exit(10)
+            entries.append(paths)
+        return entries
+
+    def run_all(self):
+        for entry in self.read_manifest():
+            exit_code = self.run(entry)
+            try:
+                with open(entry['rc'], 'w') as file:
+                    file.write(str(exit_code))
+            except OSError:
+                if DEBUG:
+                    print("Return code file cannot be opened")
+                sys.exit(12)
+
+    def program(self, path):
+        # returns the exit code of loading and the program, a source that failed keeps its exit code
+        path = os.path.normpath(path)
+        if path not in self.programs:
+            parser = Parser()
+            try:
+                with parser.open_source(path) as source:
+                    parser.load_program(source, self.cache)
+                self.programs[path] = 0, parser.program
+            except SystemExit as error:
+                self.programs[path] = exit_status(error), None
+        return self.programs[path]
+
+    def run(self, entry):
+        # returns the exit code of the entry, its output file is written even if the source is invalid
+        parser = Parser()
+        args = argparse.Namespace(**vars(self.options))
+        args.input = args.output = None
+        try:
+            args.output = parser.open_output(entry['output'])
+            exit_code, parser.program = self.program(entry['source'])
+            if exit_code:
+                return exit_code
+            args.input = parser.open_input(entry['input']) if 'input' in entry else io.StringIO()
+            interpret(parser, args)
+            return 0
+        except SystemExit as error:
+            return exit_status(error)
+        except Exception:
+            traceback.print_exc()
+            return 1
+        finally:
+            for file in (args.input, args.output):
+                if file is not None:
+                    file.close()
+
+
+def exit_status(error):
+    # exit code of the process for a SystemExit
+    if error.code is None:
+        return 0
+    if isinstance(error.code, int):
+        return error.code
+    print(error.code, file=sys.stderr)
+    return 1
+
+
+def send_message(connection, header, payloads):
+    # a message is the length of a JSON header, the header and the payloads it gives the sizes of
+    header = dict(header, payloads=[(name, len(data)) for name, data in payloads.items()])
+    data = json.dumps(header).encode()
+    connection.sendall(b''.join([struct.pack('!I', len(data)), data, *payloads.values()]))
+
+
+def receive_message(connection):
+    stream = connection.makefile('rb')
+    size = stream.read(4)
+    if len(size) != 4:
+        raise ValueError("incomplete message")
+    header = json.loads(stream.read(struct.unpack('!I', size)[0]))
+    payloads = {}
+    for name, length in header.pop('payloads'):
+        payloads[name] = stream.read(length)
+        if len(payloads[name]) != length:
+            raise ValueError("incomplete message")
+    return header, payloads
 
 
 class Parser:
     def __init__(self):
-        self.instructions = []
-        self.orders = []
-        self.arg_pattern = "arg[1-9][0-9]*"
+        self.program = Program()
+        self.orders = set()
+        self.input_buffer_size = 1 << 16
+        self.arg_pattern = re.compile("arg[1-9][0-9]*")
+        self.escape_pattern = re.compile(r"\\([0-9]{3})?")
+        self.jump_opcodes = ['JUMP', 'CALL', 'JUMPIFEQ', 'JUMPIFNEQ', 'JUMPIFEQS', 'JUMPIFNEQS']
         # self.valid_arg_types = ['label', 'var', 'type', 'symb', 'int', 'bool', 'string', 'nil', 'float']
 
-    def sort_instructions(self):
-        self.instructions.sort(key=lambda x: int(x.order))
+    def index_labels(self):
+        # map every label to the index of its LABEL instruction
+        program = self.program
+        program.labels = {}
+        label_opcode = instructions_map.opcode_ids['LABEL']
+        jump_opcodes = {instructions_map.opcode_ids[opcode] for opcode in self.jump_opcodes}
+        for i in range(len(program)):
+            if program.opcodes[i] == label_opcode:
+                label = program.args(i)[0].value
+                if label in program.labels:
+                    if DEBUG:
+                        print("Label already exists")
+                    sys.exit(52)
+                program.labels[label] = i
+
+        # every jump has to point to an existing label
+        for i in range(len(program)):
+            if program.opcodes[i] in jump_opcodes and program.args(i)[0].value not in program.labels:
+                if DEBUG:
+                    print("Label not found")
+                sys.exit(52)
 
     def is_valid_order(self, order):
         if order is None:
             return False
         try:
-            if int(order) < 1:
+            # orders are kept in a 64 bit array
+            if not 1 <= int(order) < 1 << 63:
                 return False
         except ValueError:
             return False
         if order in self.orders:
             return False
-        self.orders.append(order)
+        self.orders.add(order)
         return True
 
     def is_valid_opcode(self, opcode):
@@ -740,80 +2742,260 @@ class Parser:
             return False
         return True
 
-    def verify_xml(self, xml):
-        root = self.parse_xml(xml)
-        # check if root element is valid
-        if root is None:
+    def load_program(self, source, cache=None):
+        if cache is None:
+            self.verify_xml(source)
+            return
+        key, source = cache.key(source)
+        program = cache.load(key)
+        if program is not None:
+            self.program = Program.unpack(program)
+            return
+        self.verify_xml(source)
+        cache.store(key, self.program.pack())
+
+    def verify_xml(self, source):
+        # the program is parsed as a stream of events and every instruction element is dropped
+        # once it has been added to the program
+        events = ET.iterparse(source, events=('start', 'end'))
+        depth = 0
+        root = None
+        ins = None
+        # the loader only allocates objects that stay alive, cyclic garbage collection would just
+        # rescan them over and over
+        gc.disable()
+        try:
+            for event, element in events:
+                try:
+                    if event == 'start':
+                        depth += 1
+                        if depth == 1:
+                            root = element
+                            # check if root element is program
+                            if root.tag != "program" or root.attrib.get("language") != "IPPcode23":
+                                if DEBUG:
+                                    print("Invalid root element")
+                                raise StructureError
+                        elif depth == 2:
+                            ins = self.start_instruction(element)
+                        continue
+
+                    depth -= 1
+                    if depth == 2:
+                        ins.add_argument(self.parse_argument(element))
+                    elif depth == 1:
+                        ins.sort_arguments()
+                        self.program.append(ins.opcode, int(ins.order), ins.args)
+                        element.clear()
+                        root.clear()
+                except StructureError:
+                    self.structure_error(events)
+        except ET.ParseError:
+            if DEBUG:
+                print("Invalid XML")
+            sys.exit(31)
+        finally:
+            gc.enable()
+
+        self.program.sort()
+        self.program.finish()
+        self.orders = set()
+        self.index_labels()
+
+    def structure_error(self, events):
+        # a malformed document has to be reported with 31 even if its structure is wrong earlier,
+        # so the rest of the stream is still checked before exiting
+        try:
+            for event, element in events:
+                element.clear()
+        except ET.ParseError:
             if DEBUG:
-                print("No root element")
+                print("Invalid XML")
             sys.exit(31)
+        sys.exit(32)
+
+    def start_instruction(self, element):
+        if element.tag != "instruction":
+            if DEBUG:
+                print("Invalid instruction")
+            raise StructureError
+        opcode = element.attrib.get("opcode")
+        order = element.attrib.get("order")
 
-        # check if root element is program
-        if root.tag != "program" or root.attrib["language"] != "IPPcode23":
+        if not self.is_valid_opcode(opcode) or not self.is_valid_order(order):
             if DEBUG:
-                print("Invalid root element")
-            sys.exit(32)
+                print("Invalid opcode or order")
+            raise StructureError
+        return Instruction(opcode, order)
 
-        for instruction in root:
-            if instruction.tag != "instruction":
+    def parse_argument(self, element):
+        # check whether the tag is valid
+        if not self.arg_pattern.fullmatch(element.tag):
+            if DEBUG:
+                print("Invalid argument")
+            raise StructureError
+        arg_num = element.tag[3:]
+        arg_type = element.attrib.get("type")
+        if arg_type == 'var':
+            arg_frame, _, var_name = (element.text or '').strip().partition('@')
+            if arg_frame not in ('GF', 'LF', 'TF') or not var_name:
                 if DEBUG:
-                    print("Invalid instruction")
-                sys.exit(32)
-            opcode = instruction.attrib.get("opcode")
-            order = instruction.attrib.get("order")
+                    print("Invalid variable", element.text)
+                raise StructureError
+            return Argument(arg_type, None, arg_num, arg_frame, var_name)
+        if arg_type in instructions_map.const:
+            return Argument(arg_type, self.convert_literal(arg_type, element.text), arg_num)
+        if arg_type not in ('label', 'type'):
+            if DEBUG:
+                print("Invalid argument type", arg_type)
+            raise StructureError
+        return Argument(arg_type, (element.text or '').strip(), arg_num)
+
+    @staticmethod
+    def convert_float(text):
+        try:
+            return float.fromhex(text)
+        except ValueError:
+            return float(text)
 
-            if not self.is_valid_opcode(opcode) or not self.is_valid_order(order):
+    def convert_literal(self, arg_type, text):
+        # literals are converted to python values once, while loading
+        if text is None:
+            text = ''
+        try:
+            if arg_type == 'int':
+                try:
+                    return int(text)
+                except ValueError:
+                    return int(text, 0)
+            if arg_type == 'float':
+                return self.convert_float(text)
+        except ValueError:
+            if DEBUG:
+                print("Invalid literal", arg_type, text)
+            raise StructureError
+        if arg_type == 'bool':
+            if text not in ('true', 'false'):
                 if DEBUG:
-                    print("Invalid opcode or order")
-                sys.exit(32)
+                    print("Invalid literal", arg_type, text)
+                raise StructureError
+            return text == 'true'
+        if arg_type == 'nil':
+            if text != 'nil':
+                if DEBUG:
+                    print("Invalid literal", arg_type, text)
+                raise StructureError
+            return None
+        return self.decode_escapes(text)
+
+    def decode_escapes(self, text):
+        # string literals are decoded once, while loading, so the program works with the actual text
+        if '\\' not in text:
+            return text
+        return self.escape_pattern.sub(self.decode_escape, text)
+
+    @staticmethod
+    def decode_escape(match):
+        if match.group(1) is None:
+            if DEBUG:
+                print("Invalid escape sequence")
+            raise StructureError
+        return chr(int(match.group(1)))
 
-            ins = Instruction(opcode, order)
-            for arg in instruction:
-                # check whether the tag is valid
-                if not re.match(self.arg_pattern, arg.tag):
-                    if DEBUG:
-                        print("Invalid argument")
-                    sys.exit(32)
-                arg_word = ET.tostring(arg, encoding='unicode', method='xml').strip()
-                arg_num = arg_word.split(" ")[0][4:]
-                arg_frame = arg_word.split(" ")[1][11:13]
-                arg_type = arg.attrib.get("type")
-                var_name = arg_word.split(" ")[1][14:-7]
-                if arg_type == 'var':
-                    argument = Argument(arg_type, None, arg_num, arg_frame, var_name)
-                else:
-                    argument = Argument(arg_type, arg.text, arg_num)
-                ins.add_argument(argument)
-            self.instructions.append(ins)
-            # print the arguments of instructions
-            ins.sort_arguments()
-        self.sort_instructions()
-        # for ins in self.instructions:
-        #     ins.print_arguments()
-
-    def parse_xml(self, xml):
+    @staticmethod
+    def escape_string(text):
+        # string as written in the source, with whitespace, control characters, # and \\ escaped
+        return ''.join('\\%03d' % ord(char) if ord(char) <= 32 or char in '#\\' else char for char in text)
+
+    def open_source(self, file_path):
         try:
-            root = ET.fromstring(xml)
-            return root
-        except Exception:
+            return open(file_path, 'rb')
+        except OSError:
             if DEBUG:
-                print("Invalid XML")
-            sys.exit(31)
+                print("Source file cannot be opened")
+            sys.exit(11)
+
+    def open_input(self, file_path):
+        try:
+            return open(file_path, 'r', encoding='utf-8', buffering=self.input_buffer_size)
+        except OSError:
+            if DEBUG:
+                print("Input file cannot be opened")
+            sys.exit(11)
 
-    def read_file_content(self, file_path):
-        with open(file_path, 'r', encoding='utf-8') as file:
-            content = file.read()
-        return content
+    def open_output(self, file_path):
+        try:
+            return open(file_path, 'w', encoding='utf-8')
+        except OSError:
+            if DEBUG:
+                print("Output file cannot be opened")
+            sys.exit(12)
 
-    def parse_arguments(self):
+    def parse_options(self, argv=None):
+        # command line options, without opening any of the files
         parser = argparse.ArgumentParser(add_help=False)
         parser.add_argument('--source', type=str, metavar='file',
                             help='Input file with the XML representation of the source code.')
         parser.add_argument('--input', type=str, metavar='file',
                             help='File with inputs for the actual interpretation of the source code.')
+        parser.add_argument('--output', type=str, metavar='file',
+                            help='File to write the program output to instead of the standard output.')
+        parser.add_argument('--output-buffer', type=int, metavar='bytes', default=1 << 20,
+                            help='Size of the output buffer.')
+        parser.add_argument('--cache-dir', type=str, metavar='dir',
+                            help='Directory for caching validated programs between runs.')
+        parser.add_argument('--optimize', type=str, metavar='passes', default='',
+                            help='Comma separated optimization passes to run: fold, types, peephole.')
+        parser.add_argument('--profile', type=str, metavar='file',
+                            help='Profile the execution, write a report to stderr and the data as JSON to file.')
+        parser.add_argument('--profile-calls', type=str, metavar='file',
+                            help='Profile subroutine calls, write a report to stderr and folded stacks to file.')
+        parser.add_argument('--trace-last', type=int, metavar='N', default=0,
+                            help='Keep the last N executed instructions and dump them on abnormal exit.')
+        parser.add_argument('--trace-file', type=str, metavar='file', default='interpret.trace',
+                            help='File for the dumped trace, interpret.trace by default.')
+        parser.add_argument('--engine', type=str, metavar='engine', default='interpreted',
+                            help='Execution engine: interpreted, or compiled to Python functions.')
+        parser.add_argument('--stats', type=str, metavar='file',
+                            help='Write the load and execution times as JSON to file.')
+        parser.add_argument('--serve', type=str, metavar='socket',
+                            help='Run as a server executing jobs sent to the Unix socket by interpret_client.py.')
+        parser.add_argument('--batch', type=str, metavar='manifest',
+                            help='Run every source, input, output and return code file named in the JSON Lines manifest.')
         parser.add_argument("--help", "--h", action="store_true",
                             help="Show this help message")
-        args = parser.parse_args()
+        args = parser.parse_args(argv)
+        args.optimize = set(filter(None, args.optimize.split(',')))
+        if args.trace_last < 0:
+            if DEBUG:
+                print("Trace size cannot be negative")
+            sys.exit(10)
+        if args.engine not in ('interpreted', 'compiled'):
+            if DEBUG:
+                print("Unknown engine")
+            sys.exit(10)
+        if args.engine == 'compiled' and (args.profile or args.profile_calls or args.trace_last):
+            if DEBUG:
+                print("Compiled programs cannot be profiled or traced")
+            sys.exit(10)
+        if args.profile and args.trace_last:
+            if DEBUG:
+                print("Traced programs cannot be profiled")
+            sys.exit(10)
+        return args
+
+    def parse_arguments(self, argv=None):
+        args = self.parse_options(argv)
+        if args.serve:
+            return args
+        if args.batch:
+            # the files are named by the manifest
+            if args.source or args.input or args.output:
+                if DEBUG:
+                    print("Batch mode does not take --source, --input or --output")
+                sys.exit(10)
+            return args
+        args.output = self.open_output(args.output) if args.output else sys.stdout
 
         # help argument is not allowed with --source or --input
         if args.help and (args.source or args.input):
@@ -829,33 +3011,65 @@ class Parser:
         if not args.source and args.input:
             if DEBUG:
                 (print("Source file is not provided"))
-            args.source = sys.stdin.read()
-            args.input = self.read_file_content(args.input)
+            args.source = sys.stdin.buffer
+            args.input = self.open_input(args.input)
             return args
 
         if args.source and not args.input:
             if DEBUG:
                 print("Input file is not provided")
-            args.input = sys.stdin.read()
-            args.source = self.read_file_content(args.source)
+            args.input = sys.stdin
+            args.source = self.open_source(args.source)
             return args
 
         if args.source and args.input:
             if DEBUG:
                 print("Both source and input files are provided")
-            args.input = self.read_file_content(args.input)
-            args.source = self.read_file_content(args.source)
+            args.input = self.open_input(args.input)
+            args.source = self.open_source(args.source)
             return args
 
         return args
 
 
-def main():
-    parser = Parser()
-    args = parser.parse_arguments()
-    parser.verify_xml(args.source)
+def write_stats(path, stats):
+    # phase times of the run, used by benchmark.py
+    try:
+        with open(path, 'w') as file:
+            json.dump(stats, file)
+    except OSError:
+        if DEBUG:
+            print("Stats file cannot be opened")
+        sys.exit(12)
+
+
+def interpret(parser, args):
     interpreter = Interpreter(parser, args)
-    interpreter.execute()
+    try:
+        interpreter.execute()
+    finally:
+        # buffered output is written also when the program ends with EXIT or an error code
+        interpreter.flush_output()
+
+
+def main(argv=None):
+    parser = Parser()
+    args = parser.parse_arguments(argv)
+    cache = ProgramCache(args.cache_dir) if args.cache_dir else None
+    if args.serve:
+        Server(args.serve, cache).serve_forever()
+        return
+    if args.batch:
+        Batch(args.batch, args, cache).run_all()
+        return
+    started = time.perf_counter()
+    parser.load_program(args.source, cache)
+    loaded = time.perf_counter()
+    try:
+        interpret(parser, args)
+    finally:
+        if args.stats:
+            write_stats(args.stats, {'load': loaded - started, 'execute': time.perf_counter() - loaded})
 
     if DEBUG:
         print(f"Source file: {args.source}")
@@ -0,0 +1,114 @@
+import json
+import os
+import socket
+import struct
+import sys
+
+# Thin client for "interpret.py --serve=socket". It takes the same options as interpret.py, sends
+# the source, the input and the other options to the server and prints what the program wrote,
+# ending with its exit code. Only small modules are imported, to keep the startup short.
+#   --socket=path   socket of the server, $IPP_SOCKET or /tmp/interpret.sock by default
+#   --program=id    run a program the server has already loaded, id is the SHA-256 of its source
+# When no server is running, interpret.py is run instead.
+
+INTERPRET = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'interpret.py')
+# options with a file the server writes, relative paths are made absolute for it
+PATH_OPTIONS = ('--profile', '--profile-calls', '--trace-file', '--stats')
+
+
+def send_message(connection, header, payloads):
+    header = dict(header, payloads=[(name, len(data)) for name, data in payloads.items()])
+    data = json.dumps(header).encode()
+    connection.sendall(b''.join([struct.pack('!I', len(data)), data, *payloads.values()]))
+
+
+def receive_message(connection):
+    stream = connection.makefile('rb')
+    size = stream.read(4)
+    if len(size) != 4:
+        raise ValueError("incomplete message")
+    header = json.loads(stream.read(struct.unpack('!I', size)[0]))
+    payloads = {}
+    for name, length in header.pop('payloads'):
+        payloads[name] = stream.read(length)
+        if len(payloads[name]) != length:
+            raise ValueError("incomplete message")
+    return header, payloads
+
+
+def parse_arguments(argv):
+    options = {'socket': os.environ.get('IPP_SOCKET', '/tmp/interpret.sock')}
+    forwarded = []
+    arguments = iter(argv)
+    for argument in arguments:
+        name, separator, value = argument.partition('=')
+        if name in ('--socket', '--program', '--source', '--input', '--output'):
+            options[name[2:]] = value if separator else next(arguments, '')
+        elif name in PATH_OPTIONS:
+            forwarded.append(f"{name}={os.path.abspath(value if separator else next(arguments, ''))}")
+        else:
+            forwarded.append(argument)
+    return options, forwarded
+
+
+def read_file(path, exit_code):
+    try:
+        with open(path, 'rb') as file:
+            return file.read()
+    except OSError:
+        sys.exit(exit_code)
+
+
+def main():
+    options, forwarded = parse_arguments(sys.argv[1:])
+    source = options.get('source')
+    input_path = options.get('input')
+    program = options.get('program')
+    if not source and not input_path and not program:
+        sys.exit(10)
+
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(options['socket'])
+    except OSError:
+        if program:
+            print("No server is running", file=sys.stderr)
+            sys.exit(11)
+        files = [f'--{name}={options[name]}' for name in ('source', 'input', 'output') if options.get(name)]
+        os.execv(sys.executable, [sys.executable, INTERPRET, *forwarded, *files])
+
+    payloads = {}
+    header = {'argv': forwarded}
+    if program and not source:
+        header['program'] = program
+    elif source:
+        payloads['source'] = read_file(source, 11)
+    else:
+        payloads['source'] = sys.stdin.buffer.read()
+    if input_path:
+        payloads['input'] = read_file(input_path, 11)
+    elif source or program:
+        payloads['input'] = sys.stdin.buffer.read()
+
+    with connection:
+        try:
+            send_message(connection, header, payloads)
+            header, payloads = receive_message(connection)
+        except (OSError, ValueError):
+            print("Incomplete reply from the server", file=sys.stderr)
+            sys.exit(99)
+
+    if options.get('output'):
+        try:
+            with open(options['output'], 'wb') as file:
+                file.write(payloads['stdout'])
+        except OSError:
+            sys.exit(12)
+    else:
+        sys.stdout.buffer.write(payloads['stdout'])
+    sys.stderr.buffer.write(payloads['stderr'])
+    sys.exit(header['exit_code'])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import argparse
+import html
+import importlib.util
+import io
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+# Test runner for the interpreter. Tests are found the same way as by test.php: every .src file
+# is a test, with the .in, .out and .rc files of the same name next to it (missing ones are
+# created empty, .rc with 0). The tests run in a pool of worker processes, every worker imports
+# the interpreter once and runs the tests in-process.
+
+interpreter = None
+
+
+def load_interpreter(path):
+    global interpreter
+    directory = os.path.dirname(os.path.abspath(path))
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+    spec = importlib.util.spec_from_file_location('interpret', path)
+    interpreter = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(interpreter)
+
+
+class TestFile:
+    def __init__(self, path, name):
+        self.path = path
+        self.name = name
+
+    def file(self, extension):
+        return os.path.join(self.path, self.name + '.' + extension)
+
+
+class Test:
+    def __init__(self, test_file, output, return_code, expected_out, expected_rc):
+        self.test_name = test_file.name
+        self.test_path = test_file.path
+        self.output = output
+        self.return_code = return_code
+        self.expected_out = expected_out
+        self.expected_rc = expected_rc
+        self.is_ok = output == expected_out and str(return_code) == expected_rc
+
+
+def find_tests(directory, recursive):
+    tests = []
+    for path, directories, files in os.walk(directory):
+        directories.sort()
+        if not recursive:
+            directories.clear()
+        names = sorted(file[:-4] for file in files if file.endswith('.src'))
+        for name in names:
+            test_file = TestFile(path, name)
+            # missing files mean no input, no output and return code 0
+            for extension, content in (('in', ''), ('out', ''), ('rc', '0')):
+                if not os.path.exists(test_file.file(extension)):
+                    with open(test_file.file(extension), 'w') as file:
+                        file.write(content)
+            tests.append(test_file)
+    return tests
+
+
+def read_file(path):
+    with open(path, encoding='utf-8', errors='replace') as file:
+        return file.read()
+
+
+def run_test(test_file):
+    # runs the interpreter like "interpret.py --source=test.src --input=test.in" in this process
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout = output = io.StringIO()
+    sys.stderr = io.StringIO()
+    try:
+        interpreter.main([f'--source={test_file.file("src")}', f'--input={test_file.file("in")}'])
+        return_code = 0
+    except SystemExit as error:
+        if error.code is None:
+            return_code = 0
+        elif isinstance(error.code, int):
+            return_code = error.code
+        else:
+            return_code = 1
+    except Exception:
+        # uncaught exception, python3 would end with 1
+        return_code = 1
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+    return Test(test_file, output.getvalue(), return_code, read_file(test_file.file('out')),
+                read_file(test_file.file('rc')).strip())
+
+
+class TestEnv:
+    def __init__(self, tests):
+        self.tests = {}
+        for test in tests:
+            self.tests.setdefault(test.test_path, []).append(test)
+        self.ok_test_count = sum(test.is_ok for test in tests)
+        self.failed_test_count = len(tests) - self.ok_test_count
+
+    def get_html(self):
+        test_count = self.ok_test_count + self.failed_test_count
+        parts = [f"""<!DOCTYPE html>
+<head>
+    <meta charset="UTF-8">
+    <meta name="description" content="Test results">
+    <style>
+    th, td {{ padding-left:10px; padding-right:10px; color:white; }}
+    h1,h2,h3,h4 {{ color:white; }}
+    textarea {{ background-color: rgb(18, 18, 18); color:white; }}
+    body {{ padding-left: 1em; padding-right: 1em; background-color: rgb(18, 18, 18); }}
+    </style>
+</head>
+
+<body>
+    <h1 style="text-align: center;">Test result</h1>
+    <h2>Tests run: {test_count}</h2>
+    <h2>Passed: {self.ok_test_count} </h2>
+    <h2>Failed: {self.failed_test_count} </h2>
+    <hr>
+    <h3 style="text-align: center; color:red">Failed tests</h3>"""]
+
+        for test_path, tests in self.tests.items():
+            failed = [test for test in tests if not test.is_ok]
+            if not failed:
+                continue
+            parts.append(f"<hr><h4>{html.escape(test_path)}</h4><table><tr><th>Test name</th><th>Return code</th>"
+                         "<th>Expected return code</th><th>Output</th><th>Expected output</th></tr>")
+            for test in failed:
+                parts.append(f"\n<tr><td>{html.escape(test.test_name)}</td><td>{test.return_code}</td>"
+                             f"<td>{html.escape(test.expected_rc)}</td>"
+                             f"<td><textarea readonly rows=5 cols=50>{html.escape(test.output)}</textarea></td>"
+                             f"<td><textarea readonly rows=5 cols=50>{html.escape(test.expected_out)}</textarea></td>"
+                             "</tr>\n")
+            parts.append("\n</table>\n")
+
+        parts.append("<hr><h3 style=\"text-align: center; color:green\">Passed tests</h3>")
+        for test_path, tests in self.tests.items():
+            passed = [test for test in tests if test.is_ok]
+            if not passed:
+                continue
+            parts.append(f"<hr><h4>{html.escape(test_path)}</h4><table><tr><th>Test name</th><th>Return code</th>"
+                         "<th>Output</th></tr>")
+            for test in passed:
+                parts.append(f"\n<tr><td>{html.escape(test.test_name)}</td><td>{test.return_code}</td>"
+                             f"<td><textarea readonly rows=5 cols=50>{html.escape(test.expected_out)}</textarea></td>"
+                             "</tr>\n")
+            parts.append("\n</table>\n")
+        parts.append("</body></html>")
+        return ''.join(parts)
+
+
+class ArgumentParser(argparse.ArgumentParser):
+    # wrong parameters end with 10, as in test.php
+    def error(self, message):
+        self.print_usage(sys.stderr)
+        print(f"{self.prog}: error: {message}", file=sys.stderr)
+        sys.exit(10)
+
+
+def parse_arguments():
+    parser = ArgumentParser(description='Run the interpreter tests and print an HTML summary.')
+    parser.add_argument('--directory', default='.', help='Look for tests in the directory.')
+    parser.add_argument('--recursive', action='store_true', help='Look for tests also in subdirectories.')
+    parser.add_argument('--int-script', default='interpret.py', help='Interpreter to test.')
+    parser.add_argument('--int-only', action='store_true', help='Test only the interpreter, the only supported mode.')
+    parser.add_argument('--noclean', action='store_true', help='Kept for test.php compatibility, no files are made.')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='Number of worker processes.')
+    args = parser.parse_args()
+    if not os.path.isdir(args.directory):
+        print(f"{args.directory} not found", file=sys.stderr)
+        sys.exit(41)
+    if not os.path.isfile(args.int_script):
+        print(f"{args.int_script} not found", file=sys.stderr)
+        sys.exit(41)
+    return args
+
+
+def main():
+    args = parse_arguments()
+    test_files = find_tests(args.directory, args.recursive)
+    with ProcessPoolExecutor(max_workers=args.jobs, initializer=load_interpreter,
+                             initargs=(args.int_script,)) as pool:
+        chunk_size = max(1, len(test_files) // (4 * args.jobs))
+        tests = list(pool.map(run_test, test_files, chunksize=chunk_size))
+    print(TestEnv(tests).get_html())
+
+
+if __name__ == "__main__":
+    main()
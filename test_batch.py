@@ -0,0 +1,82 @@
+import io
+import json
+import os
+import sys
+import tempfile
+
+import interpret
+from benchmark import write_program, var, integer, string
+
+# Entries of a batch manifest that share a source must behave as separate runs of the interpreter.
+# Run with pytest or python3.
+
+MODES = [
+    [],
+    ['--optimize=fold,types,peephole'],
+    ['--engine=compiled'],
+]
+
+# name, instructions
+SOURCES = [
+    ('literal_in_variable_slot', [
+        ('WRITE', integer(5)), ('MOVE', integer(5), integer(6)),
+    ]),
+    ('globals', [
+        # DEFVAR of the same variable again would end with 52 if the entries shared frames
+        ('DEFVAR', var('GF@x')), ('READ', var('GF@x'), ('type', 'int')),
+        ('PUSHS', var('GF@x')), ('PUSHS', integer(1)), ('ADDS',), ('POPS', var('GF@x')),
+        ('WRITE', var('GF@x')),
+    ]),
+    ('concat', [
+        ('DEFVAR', var('GF@s')), ('MOVE', var('GF@s'), string('a')),
+        ('CONCAT', var('GF@s'), var('GF@s'), string('b')),
+        ('WRITE', var('GF@s')), ('WRITE', string('a')),
+    ]),
+]
+
+# source, input, exit code, output
+ENTRIES = [
+    ('literal_in_variable_slot', None, 32, ''),
+    ('globals', '1\n', 0, '2'),
+    ('concat', None, 0, 'aba'),
+    ('literal_in_variable_slot', None, 32, ''),
+    ('globals', '2\n', 0, '3'),
+    ('concat', None, 0, 'aba'),
+]
+
+
+def run_batch(directory, options):
+    # runs one manifest in this process, returns the exit code and output of every entry
+    with open(os.path.join(directory, 'manifest.jsonl'), 'w') as manifest:
+        for number, (name, input_text, _, _) in enumerate(ENTRIES):
+            entry = {'source': name + '.xml', 'output': f'{number}.out', 'rc': f'{number}.rc'}
+            if input_text is not None:
+                entry['input'] = f'{number}.in'
+                with open(os.path.join(directory, entry['input']), 'w') as file:
+                    file.write(input_text)
+            manifest.write(json.dumps(entry) + '\n')
+    stderr = sys.stderr
+    sys.stderr = io.StringIO()
+    try:
+        interpret.main([f'--batch={manifest.name}', *options])
+    finally:
+        sys.stderr = stderr
+    results = []
+    for number in range(len(ENTRIES)):
+        with open(os.path.join(directory, f'{number}.rc')) as rc, open(os.path.join(directory, f'{number}.out')) as out:
+            results.append((int(rc.read()), out.read()))
+    return results
+
+
+def test_batch_entries_run_fresh():
+    with tempfile.TemporaryDirectory() as directory:
+        for name, instructions in SOURCES:
+            write_program(os.path.join(directory, name + '.xml'), instructions)
+        expected = [(exit_code, output) for _, _, exit_code, output in ENTRIES]
+        for options in MODES:
+            assert run_batch(directory, options) == expected, ' '.join(options)
+
+
+if __name__ == "__main__":
+    test_batch_entries_run_fresh()
+    print("ok")
@@ -0,0 +1,62 @@
+import io
+import os
+import sys
+import tempfile
+
+import interpret
+
+# Programs the loader has to reject, each with the exit code and output of the plain interpreter.
+# Run with pytest or python3.
+
+HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n<program language="IPPcode23">\n'
+
+# name, instruction elements, exit code, output
+PROGRAMS = [
+    ('literal_in_variable_slot', [
+        # literals are shared by the program, MOVE must not change the other uses of int@5
+        '<instruction order="1" opcode="MOVE"><arg1 type="int">5</arg1><arg2 type="int">6</arg2></instruction>',
+        '<instruction order="2" opcode="WRITE"><arg1 type="int">5</arg1></instruction>',
+    ], 32, ''),
+    ('unknown_argument_type', [
+        '<instruction order="1" opcode="WRITE"><arg1 type="foo">1</arg1></instruction>',
+    ], 32, ''),
+    ('missing_argument_type', [
+        '<instruction order="1" opcode="WRITE"><arg1>1</arg1></instruction>',
+    ], 32, ''),
+    ('argument_tag_with_suffix', [
+        '<instruction order="1" opcode="WRITE"><arg1x type="int">1</arg1x></instruction>',
+    ], 32, ''),
+    ('label_in_symbol_slot', [
+        '<instruction order="1" opcode="WRITE"><arg1 type="label">end</arg1></instruction>',
+    ], 32, ''),
+]
+
+
+def run(directory, name, instructions):
+    # runs the interpreter in this process, returns the exit code and the output
+    source = os.path.join(directory, name + '.xml')
+    with open(source, 'w') as file:
+        file.write(HEADER + '\n'.join(instructions) + '\n</program>\n')
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout = output = io.StringIO()
+    sys.stderr = io.StringIO()
+    try:
+        interpret.main([f'--source={source}', f'--input={os.devnull}'])
+        exit_code = 0
+    except SystemExit as error:
+        exit_code = error.code or 0
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+    return exit_code, output.getvalue()
+
+
+def test_loader_rejects_invalid_programs():
+    with tempfile.TemporaryDirectory() as directory:
+        for name, instructions, exit_code, output in PROGRAMS:
+            result = run(directory, name, instructions)
+            assert result == (exit_code, output), f"{name}: {result} instead of {(exit_code, output)}"
+
+
+if __name__ == "__main__":
+    test_loader_rejects_invalid_programs()
+    print("ok")
@@ -0,0 +1,181 @@
+import io
+import os
+import sys
+import tempfile
+
+import interpret
+from benchmark import write_program, var, integer, string, label
+
+# Every program has to behave the same with every optimization and engine as with the plain
+# interpreter: the same output and the same exit code. Run with pytest or python3.
+
+MODES = [
+    ['--optimize=peephole'],
+    ['--optimize=types'],
+    ['--optimize=fold'],
+    ['--optimize=fold,types,peephole'],
+    ['--engine=compiled'],
+]
+
+
+def boolean(value):
+    return 'bool', value
+
+
+def floating(value):
+    return 'float', value
+
+
+# name, instructions, input, exit code of the plain interpreter
+PROGRAMS = [
+    ('compare_and_jump_loop', [
+        ('DEFVAR', var('GF@i')), ('DEFVAR', var('GF@c')),
+        ('MOVE', var('GF@i'), integer(0)),
+        ('LABEL', label('loop')),
+        ('WRITE', var('GF@i')),
+        ('ADD', var('GF@i'), var('GF@i'), integer(1)),
+        ('LT', var('GF@c'), var('GF@i'), integer(5)),
+        ('JUMPIFEQ', label('loop'), var('GF@c'), boolean('true')),
+        ('GT', var('GF@c'), var('GF@i'), integer(3)),
+        ('JUMPIFNEQ', label('end'), boolean('false'), var('GF@c')),
+        ('WRITE', string('skipped')),
+        ('LABEL', label('end')),
+    ], '', 0),
+    ('stack_arithmetic', [
+        ('DEFVAR', var('GF@x')),
+        ('PUSHS', integer(7)), ('PUSHS', integer(3)), ('SUBS',), ('POPS', var('GF@x')),
+        ('WRITE', var('GF@x')),
+        ('PUSHS', var('GF@x')), ('PUSHS', integer(2)), ('IDIVS',), ('POPS', var('GF@x')),
+        ('WRITE', var('GF@x')),
+        ('PUSHS', floating('0x1.8p+1')), ('PUSHS', floating('0x1p+1')), ('MULS',), ('POPS', var('GF@x')),
+        ('WRITE', var('GF@x')),
+    ], '', 0),
+    ('move_chain', [
+        ('DEFVAR', var('GF@a')), ('DEFVAR', var('GF@b')), ('DEFVAR', var('GF@c')),
+        ('MOVE', var('GF@a'), string('x\\032y')), ('MOVE', var('GF@b'), var('GF@a')),
+        ('MOVE', var('GF@c'), var('GF@b')), ('MOVE', var('GF@a'), integer(1)),
+        ('WRITE', var('GF@a')), ('WRITE', var('GF@b')), ('WRITE', var('GF@c')),
+    ], '', 0),
+    ('jump_into_sequence', [
+        # a label in the middle of what would be a fused sequence, jumped to from below
+        ('DEFVAR', var('GF@a')), ('DEFVAR', var('GF@b')), ('DEFVAR', var('GF@n')),
+        ('MOVE', var('GF@n'), integer(0)), ('MOVE', var('GF@a'), integer(5)),
+        ('MOVE', var('GF@b'), var('GF@a')),
+        ('LABEL', label('middle')),
+        ('MOVE', var('GF@a'), var('GF@b')),
+        ('ADD', var('GF@n'), var('GF@n'), integer(1)),
+        ('WRITE', var('GF@n')),
+        ('PUSHS', var('GF@n')),
+        ('LABEL', label('stack')),
+        ('PUSHS', integer(1)), ('ADDS',), ('POPS', var('GF@n')),
+        ('JUMPIFNEQ', label('middle'), var('GF@n'), integer(6)),
+        ('WRITE', var('GF@a')),
+    ], '', 0),
+    ('call_returns_to_sequence', [
+        # RETURN continues at the start of a fused sequence
+        ('DEFVAR', var('GF@x')),
+        ('PUSHS', integer(2)),
+        ('CALL', label('double')),
+        ('PUSHS', integer(1)), ('PUSHS', var('GF@x')), ('ADDS',), ('POPS', var('GF@x')),
+        ('WRITE', var('GF@x')),
+        ('EXIT', integer(0)),
+        ('LABEL', label('double')),
+        ('POPS', var('GF@x')),
+        ('MUL', var('GF@x'), var('GF@x'), integer(2)),
+        ('RETURN',),
+    ], '', 0),
+    ('read_and_compare', [
+        ('DEFVAR', var('GF@x')), ('DEFVAR', var('GF@c')),
+        ('READ', var('GF@x'), ('type', 'int')),
+        ('EQ', var('GF@c'), var('GF@x'), integer(42)),
+        ('JUMPIFEQ', label('yes'), var('GF@c'), boolean('true')),
+        ('WRITE', string('no')),
+        ('EXIT', integer(3)),
+        ('LABEL', label('yes')),
+        ('WRITE', string('yes')),
+    ], '42\n', 0),
+    ('compare_wrong_types', [
+        # 53 in the compare of a fused compare and jump, after some output
+        ('DEFVAR', var('GF@c')),
+        ('WRITE', string('before')),
+        ('LT', var('GF@c'), integer(1), string('a')),
+        ('JUMPIFEQ', label('end'), var('GF@c'), boolean('true')),
+        ('LABEL', label('end')),
+    ], '', 53),
+    ('idiv_of_floats', [
+        # IDIV of two floats leaves the int in x, so the ADD has to fail
+        ('DEFVAR', var('GF@x')), ('DEFVAR', var('GF@y')),
+        ('MOVE', var('GF@x'), integer(7)),
+        ('IDIV', var('GF@x'), floating('0x1p+0'), floating('0x1p+1')),
+        ('ADD', var('GF@y'), var('GF@x'), floating('0x1p+0')),
+        ('WRITE', var('GF@y')),
+    ], '', 53),
+    ('stack_wrong_types', [
+        ('DEFVAR', var('GF@x')),
+        ('PUSHS', integer(1)), ('PUSHS', string('a')), ('ADDS',), ('POPS', var('GF@x')),
+    ], '', 53),
+    ('move_chain_undefined', [
+        # 54 in the middle of a chain of moves, the moves before it are done
+        ('DEFVAR', var('GF@a')), ('DEFVAR', var('GF@b')),
+        ('MOVE', var('GF@a'), integer(1)), ('MOVE', var('GF@b'), var('GF@a')),
+        ('MOVE', var('GF@missing'), var('GF@b')), ('MOVE', var('GF@a'), var('GF@missing')),
+    ], '', 54),
+    ('stack_pops_undefined', [
+        ('PUSHS', integer(1)), ('PUSHS', integer(2)), ('ADDS',), ('POPS', var('GF@missing')),
+    ], '', 54),
+    ('move_chain_uninitialized', [
+        # 56 right after a chain of moves of an uninitialized variable
+        ('DEFVAR', var('GF@a')), ('DEFVAR', var('GF@b')), ('DEFVAR', var('GF@c')), ('DEFVAR', var('GF@d')),
+        ('MOVE', var('GF@b'), var('GF@a')), ('MOVE', var('GF@c'), var('GF@b')),
+        ('INT2FLOAT', var('GF@d'), var('GF@c')),
+    ], '', 56),
+    ('return_without_call', [
+        ('DEFVAR', var('GF@x')),
+        ('PUSHS', integer(1)), ('PUSHS', integer(2)), ('ADDS',), ('POPS', var('GF@x')), ('RETURN',),
+    ], '', 56),
+    ('stack_division_by_zero', [
+        ('DEFVAR', var('GF@x')),
+        ('WRITE', string('before')),
+        ('PUSHS', integer(1)), ('PUSHS', integer(0)), ('IDIVS',), ('POPS', var('GF@x')),
+    ], '', 57),
+    ('division_by_zero', [
+        ('DEFVAR', var('GF@x')), ('DEFVAR', var('GF@c')),
+        ('MOVE', var('GF@x'), integer(0)),
+        ('IDIV', var('GF@x'), integer(1), var('GF@x')),
+    ], '', 57),
+]
+
+
+def run(directory, name, instructions, input_text, options):
+    # runs the interpreter in this process, returns the exit code and the output
+    source = os.path.join(directory, name + '.xml')
+    input_path = os.path.join(directory, name + '.in')
+    write_program(source, instructions)
+    with open(input_path, 'w') as file:
+        file.write(input_text)
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout = output = io.StringIO()
+    sys.stderr = io.StringIO()
+    try:
+        interpret.main([f'--source={source}', f'--input={input_path}', *options])
+        exit_code = 0
+    except SystemExit as error:
+        exit_code = error.code or 0
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+    return exit_code, output.getvalue()
+
+
+def test_optimizations_keep_behaviour():
+    with tempfile.TemporaryDirectory() as directory:
+        for name, instructions, input_text, expected_code in PROGRAMS:
+            expected = run(directory, name, instructions, input_text, [])
+            assert expected[0] == expected_code, f"{name}: plain run ended with {expected[0]}"
+            for options in MODES:
+                result = run(directory, name, instructions, input_text, options)
+                assert result == expected, f"{name} {' '.join(options)}: {result} instead of {expected}"
+
+
+if __name__ == "__main__":
+    test_optimizations_keep_behaviour()
+    print("ok")
@@ -0,0 +1,61 @@
+import os
+import tempfile
+import tracemalloc
+
+from interpret import Parser, Instruction, Argument
+from benchmark import write_program, huge_program
+
+# The loaded Program has to take much less memory than the same program kept as Instruction
+# objects with lists of Argument objects. Run with pytest or python3.
+
+SIZE = 20000
+
+
+def traced_size(build):
+    # memory still held by what build returns
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = build()
+        return result, tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+
+def load(path):
+    parser = Parser()
+    with open(path, 'rb') as source:
+        parser.load_program(source)
+    return parser.program
+
+
+def instruction_objects(program):
+    instructions = []
+    for index in range(len(program)):
+        instruction = Instruction(program.opcode(index), program.orders[index])
+        for order, operand in enumerate(program.args(index), 1):
+            arg_type = 'var' if operand.is_var else operand.arg_type
+            instruction.add_argument(Argument(arg_type, operand.value, order, operand.frame, operand.name))
+        instructions.append(instruction)
+    return instructions
+
+
+def measure():
+    # bytes held by the loaded Program and by the same program as objects
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'huge_program.xml')
+        write_program(path, huge_program(SIZE))
+        program, program_size = traced_size(lambda: load(path))
+    instructions, objects_size = traced_size(lambda: instruction_objects(program))
+    assert len(instructions) == len(program) == SIZE + 3
+    return program_size, objects_size
+
+
+def test_program_memory():
+    program_size, objects_size = measure()
+    assert program_size * 4 < objects_size, f"Program {program_size} bytes, objects {objects_size} bytes"
+
+
+if __name__ == "__main__":
+    test_program_memory()
+    print("Program %d bytes, objects %d bytes" % measure())
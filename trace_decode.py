@@ -0,0 +1,68 @@
+import argparse
+import sys
+
+import instructions_map
+from interpret import Parser, Trace
+
+
+def operand_text(operand):
+    # operand as written in the source
+    if operand.is_var:
+        return f"{operand.frame}@{operand.name}"
+    if operand.arg_type in ('label', 'type'):
+        return str(operand.value)
+    if operand.arg_type == 'nil':
+        return 'nil@nil'
+    if operand.arg_type == 'string':
+        return f"string@{Parser.escape_string(operand.value)}"
+    return f"{operand.arg_type}@{operand.value}"
+
+
+def load_source(path):
+    # operands of every instruction of the source, by order
+    parser = Parser()
+    with open(path, 'rb') as source:
+        parser.load_program(source)
+    program = parser.program
+    return {program.orders[index]: program.args(index) for index in range(len(program))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Print an execution trace dumped by interpret.py --trace-last.')
+    parser.add_argument('trace', help='Trace file.')
+    parser.add_argument('--source', metavar='file', help='XML source of the program, to show the operand names.')
+    args = parser.parse_args()
+
+    try:
+        with open(args.trace, 'rb') as file:
+            total, exit_code, entries = Trace.load(file)
+    except (OSError, ValueError) as error:
+        print(f"{args.trace}: {error}", file=sys.stderr)
+        sys.exit(11)
+    source = load_source(args.source) if args.source else {}
+
+    print(f"exit code {exit_code}, {total} instructions executed, last {len(entries)}:")
+    first = total - len(entries)
+    for number, (index, order, opcode, *operands) in enumerate(entries):
+        texts = []
+        names = source.get(order, [])
+        for slot in range(Trace.operand_slots):
+            kind, payload = operands[2 * slot], operands[2 * slot + 1]
+            if kind == 0:
+                break
+            value = Trace.operand_value(kind, payload)
+            type_name = Trace.kind_names[kind]
+            if kind == 8:
+                text = value
+            elif kind in (6, 7):
+                text = f"<{type_name}>"
+            else:
+                text = f"{type_name}@{value}"
+            if slot < len(names) and names[slot].is_var:
+                text = f"{operand_text(names[slot])}={text}"
+            texts.append(text)
+        print(f"{first + number + 1:>12} order {order:<8} {instructions_map.opcodes[opcode]:<12} {' '.join(texts)}")
+
+
+if __name__ == "__main__":
+    main()